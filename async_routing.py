@@ -0,0 +1,386 @@
+"""
+Asyncio-native routing API on top of OptimizedRouteEngine
+"""
+import asyncio
+import contextlib
+from typing import List, Tuple, Optional, Dict, Generator
+
+import aiohttp
+import streamlit as st
+
+from optimized_routing import OptimizedRouteEngine, AvoidanceSearch, SearchBudget, Location, Blockage, _leg_key
+from spatial_index import BlockageGridIndex
+
+
+def _advance(steps: Generator, value: Optional[Dict]) -> Optional[Tuple]:
+    """Resume a search generator with ``value``; None once it finishes (StopIteration cannot cross a future)"""
+    try:
+        return steps.send(value)
+    except StopIteration:
+        return None
+
+
+class AsyncOptimizedRouteEngine:
+    """
+    Event-loop friendly counterpart of OptimizedRouteEngine.
+    Network calls go through a pooled aiohttp session; conflict scoring and
+    network generation run in the default executor so they never stall the loop.
+    A session belongs to one event loop and lives as long as the outermost
+    call (or ``async with`` block) using it on that loop, so it is always
+    closed on its own loop. Use ``async with`` to keep one pool across calls.
+    """
+
+    def __init__(self, engine: Optional[OptimizedRouteEngine] = None, max_connections: int = 100, max_connections_per_host: int = 32):
+        self.engine = engine if engine is not None else OptimizedRouteEngine()
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        # Running loop -> [session, open scopes on that loop]
+        self._sessions: Dict[asyncio.AbstractEventLoop, List] = {}
+        self._leg_fetches: Dict[Tuple, asyncio.Future] = {}
+
+    async def __aenter__(self) -> "AsyncOptimizedRouteEngine":
+        self._open_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._release_session()
+
+    @contextlib.asynccontextmanager
+    async def _session_scope(self):
+        """The running loop's session, opened for the outermost scope and closed when it exits"""
+        session = self._open_session()
+        try:
+            yield session
+        finally:
+            await self._release_session()
+
+    def _open_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(loop)
+        if entry is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=30
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    'User-Agent': 'ComprehensiveRouteOptimizer/1.0',
+                    'Accept': 'application/json'
+                }
+            )
+            entry = self._sessions[loop] = [session, 0]
+        entry[1] += 1
+        return entry[0]
+
+    async def _release_session(self):
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(loop)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._sessions[loop]
+            await entry[0].close()
+
+    async def close(self):
+        """Close the running loop's session now, even inside open scopes"""
+        entry = self._sessions.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].close()
+
+    async def get_reliable_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None, alternatives: bool = True,
+                                 budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Get route with waypoints if specified; with a spent budget only cached or local answers are given"""
+        engine = self.engine
+
+        if engine.local_routing:
+            local_route = await asyncio.to_thread(engine._route_offline, start_lat, start_lon, end_lat, end_lon, waypoints)
+            if local_route:
+                return local_route
+
+        request = engine._build_route_request(start_lat, start_lon, end_lat, end_lon, waypoints, alternatives)
+        data = await asyncio.to_thread(engine.route_cache.get, request['cache_key'])
+        refused = False
+
+        if data is None:
+            async with self._session_scope() as session:
+                for server in engine.routing_services:
+                    if budget is not None and not budget.acquire_call():
+                        refused = True
+                        break
+
+                    try:
+                        url = f"{server}/route/v1/driving/{request['coords']}"
+                        timeout = aiohttp.ClientTimeout(total=budget.timeout(15) if budget else 15)
+
+                        async with session.get(url, params=request['params'], timeout=timeout) as response:
+                            if response.status == 200:
+                                candidate = await response.json(content_type=None)
+
+                                if candidate.get('code') == 'Ok' and candidate.get('routes'):
+                                    data = candidate
+                                    await asyncio.to_thread(engine.route_cache.put, request['cache_key'], data)
+                                    break
+
+                    except Exception:
+                        continue
+
+        if data is not None:
+            return engine._parse_route_response(data, waypoints)
+
+        offline_route = await asyncio.to_thread(engine._route_offline, start_lat, start_lon, end_lat, end_lon, waypoints)
+        if offline_route:
+            return offline_route
+
+        if refused:
+            return None
+
+        return engine._create_realistic_route(start_lat, start_lon, end_lat, end_lon, waypoints)
+
+    async def get_leg(self, start: Tuple[float, float], end: Tuple[float, float], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Single-leg route, shared with the sync engine's leg cache; concurrent requests for one leg share a fetch"""
+        route_data = self.engine.leg_cache.get(start, end)
+        if route_data is not None:
+            return route_data
+
+        key = (asyncio.get_running_loop(), _leg_key(start, end))
+        fetch = self._leg_fetches.get(key)
+        if fetch is None:
+            fetch = self._leg_fetches[key] = asyncio.ensure_future(self._fetch_leg(start, end, budget))
+            fetch.add_done_callback(lambda _: self._leg_fetches.pop(key, None))
+        return await fetch
+
+    async def _fetch_leg(self, start: Tuple[float, float], end: Tuple[float, float], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        route_data = await self.get_reliable_route(start[0], start[1], end[0], end[1], alternatives=False, budget=budget)
+        if not route_data or not route_data.get('success'):
+            return None
+        self.engine.leg_cache.put(start, end, route_data)
+        return route_data
+
+    async def get_chain_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None,
+                              budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Route through the waypoints stitched from cached legs; legs are fetched concurrently"""
+        points = self.engine._chain_points(start_lat, start_lon, end_lat, end_lon, waypoints)
+        legs = await asyncio.gather(*(self.get_leg(a, b, budget) for a, b in zip(points, points[1:])))
+        if any(leg is None for leg in legs):
+            return None
+        return self.engine._stitch_legs(list(legs))
+
+    async def distance_matrix(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Travel time (minutes) and road distance (km) for every source/target pair in one call"""
+        engine = self.engine
+        if not sources or not targets:
+            return None
+
+        # The offline matrix cannot be interrupted, so deadline-bound searches skip it
+        offline_allowed = budget is None or budget.deadline is None
+
+        if engine.local_routing and offline_allowed:
+            local_matrix = await asyncio.to_thread(engine._matrix_offline, sources, targets)
+            if local_matrix:
+                return local_matrix
+
+        matrix = await self._fetch_table(sources, targets, budget)
+        if matrix is not None or not offline_allowed:
+            return matrix
+
+        return await asyncio.to_thread(engine._matrix_offline, sources, targets)
+
+    async def _fetch_table(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """OSRM /table answer (cached or fetched) for sources x targets"""
+        engine = self.engine
+        request = engine._build_table_request(sources, targets)
+        data = await asyncio.to_thread(engine.route_cache.get, request['cache_key']) if request else None
+
+        if request and data is None:
+            async with self._session_scope() as session:
+                for server in engine.routing_services:
+                    if budget is not None and not budget.acquire_call():
+                        break
+
+                    try:
+                        url = f"{server}/table/v1/driving/{request['coords']}"
+                        timeout = aiohttp.ClientTimeout(total=budget.timeout(15) if budget else 15)
+
+                        async with session.get(url, params=request['params'], timeout=timeout) as response:
+                            if response.status == 200:
+                                candidate = await response.json(content_type=None)
+
+                                if candidate.get('code') == 'Ok' and candidate.get('durations'):
+                                    data = candidate
+                                    await asyncio.to_thread(engine.route_cache.put, request['cache_key'], data)
+                                    break
+
+                    except Exception:
+                        continue
+
+        return engine._parse_table_response(data) if data is not None else None
+
+    async def _prescreen_matrix(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Road-length matrix for the pre-screen, skipping the offline one when it would cost more than it saves"""
+        if await asyncio.to_thread(self.engine._offline_matrix_is_cheap, len(sources)):
+            return await self.distance_matrix(sources, targets, budget)
+        return await self._fetch_table(sources, targets, budget)
+
+    async def calculate_route_conflicts(self, route: List[Tuple[float, float]], blockages: List[Blockage]) -> Dict:
+        """Conflict analysis offloaded to the default executor"""
+        return await asyncio.to_thread(self.engine.calculate_route_conflicts, route, blockages)
+
+    async def find_optimal_avoidance_route(self, start: Location, end: Location, blockages: List[Blockage], deadline_ms: Optional[float] = None,
+                                           max_upstream_calls: Optional[int] = None, accept_detour_ratio: Optional[float] = None) -> Optional[Dict]:
+        """Comprehensive pathfinding that explores ALL possible routes (anytime when given a budget)"""
+        if not blockages:
+            return None
+
+        # Every request of one search shares the loop's session
+        async with self._session_scope():
+            return await self._search_avoidance_route(start, end, blockages, deadline_ms, max_upstream_calls, accept_detour_ratio)
+
+    async def _search_avoidance_route(self, start: Location, end: Location, blockages: List[Blockage], deadline_ms: Optional[float],
+                                      max_upstream_calls: Optional[int], accept_detour_ratio: Optional[float]) -> Optional[Dict]:
+        engine = self.engine
+
+        st.info("🔍 Comprehensive Route Exploration - Testing ALL possible paths...")
+
+        blockages = BlockageGridIndex.ensure(blockages)
+        budget = SearchBudget(deadline_ms, max_upstream_calls)
+
+        alternatives = await self._try_osrm_alternatives(start, end, blockages, budget)
+        if alternatives:
+            return alternatives
+
+        # Local stages cannot be interrupted, so none starts once the deadline has passed
+        if not budget.expired():
+            masked_route = await asyncio.to_thread(engine._route_around_blockages, start, end, blockages)
+            if masked_route:
+                return masked_route
+
+        if budget.expired():
+            return engine._finish_out_of_budget(start, end, budget)
+
+        st.info("🌐 Building comprehensive waypoint network...")
+        path_network = await asyncio.to_thread(engine._build_comprehensive_network, start, end, blockages)
+
+        if budget.expired():
+            return engine._finish_out_of_budget(start, end, budget)
+
+        if engine.search_strategy == "branch_and_bound":
+            return await self._find_branch_and_bound_route(start, end, path_network, blockages, budget, accept_detour_ratio)
+
+        st.info(f"📊 Generated {len(path_network)} waypoint candidates")
+
+        st.info("🔄 Exploring all possible path combinations...")
+        all_paths = await asyncio.to_thread(engine._explore_all_path_combinations, start, end, path_network, blockages, engine.PRESCREEN_POOL)
+
+        sources, targets = engine._prescreen_points(start, end, all_paths)
+        matrix = await self._prescreen_matrix(sources, targets, budget) if all_paths and not budget.expired() else None
+        all_paths = await asyncio.to_thread(engine._rank_by_road_distance, all_paths, matrix)
+
+        st.info(f"🎯 Testing {len(all_paths)} unique path combinations")
+
+        search = AvoidanceSearch(start, end, len(all_paths), budget, accept_detour_ratio,
+                                 snap_tolerance_km=engine._endpoint_snap_tolerance_km(start, end), waypoints_snapped=engine._get_offline_router() is not None)
+
+        async def evaluate(index: int, path_combo: Dict):
+            try:
+                route_data = await self.get_chain_route(
+                    start.lat, start.lon,
+                    end.lat, end.lon,
+                    path_combo['waypoints'],
+                    budget
+                )
+
+                if not route_data or not route_data.get('success'):
+                    return index, path_combo, None, None
+
+                chain_points = engine._chain_points(start.lat, start.lon, end.lat, end.lon, path_combo['waypoints'])
+                conflicts = await asyncio.to_thread(engine.chain_conflicts, chain_points, blockages)
+                if conflicts is None:
+                    conflicts = await asyncio.to_thread(engine._screen_route_conflicts, route_data['route'], blockages)
+                return index, path_combo, {'route_data': route_data, 'conflicts': conflicts}, None
+            except Exception as e:
+                return index, path_combo, None, e
+
+        progress_bar = st.progress(0)
+
+        # At most max_in_flight candidates are in flight; new ones start best-first as others finish
+        candidates = iter(enumerate(all_paths))
+        pending = {}
+
+        def submit_next():
+            if search.should_stop():
+                return
+            for i, path_combo in candidates:
+                if search.prune(i, path_combo):
+                    continue
+                pending[asyncio.ensure_future(evaluate(i, path_combo))] = i
+                return
+
+        for _ in range(max(1, engine.max_in_flight)):
+            submit_next()
+
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=budget.remaining_s(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                search.should_stop()
+                break
+
+            for finished in sorted(done, key=lambda task: pending[task]):
+                pending.pop(finished)
+                index, path_combo, evaluation, error = finished.result()
+
+                if error is None and search.needs_report(index, evaluation):
+                    try:
+                        evaluation['conflicts'] = await self.calculate_route_conflicts(evaluation['route_data']['route'], blockages)
+                    except Exception as e:
+                        error = e
+
+                if error is not None:
+                    search.record_failure(path_combo, error)
+                else:
+                    search.record(index, path_combo, evaluation)
+
+                submit_next()
+                progress_bar.progress(search.candidates_done / len(all_paths))
+
+        for task in pending:
+            task.cancel()
+
+        progress_bar.empty()
+
+        return search.finish()
+
+    async def _find_branch_and_bound_route(self, start: Location, end: Location, path_network: List, blockages: BlockageGridIndex,
+                                           budget: Optional[SearchBudget] = None, accept_detour_ratio: Optional[float] = None) -> Optional[Dict]:
+        """Drive the engine's branch-and-bound search with awaited leg fetches; its scoring steps run in the default executor"""
+        engine = self.engine
+        st.info(f"🌳 Branch and bound over {len(path_network)} waypoints (chains of up to {engine.MAX_CHAIN_WAYPOINTS})")
+
+        max_legs, _ = engine._candidate_limits()
+        search = AvoidanceSearch(start, end, 0, budget, accept_detour_ratio)
+        steps = engine._branch_and_bound_steps(start, end, path_network, blockages, search, max_legs)
+
+        progress_bar = st.progress(0)
+        calls = 0
+        request = await asyncio.to_thread(_advance, steps, None)
+        while request is not None:
+            calls += 1
+            progress_bar.progress(min(1.0, calls / max_legs))
+            leg = await self.get_leg(*request, budget)
+            request = await asyncio.to_thread(_advance, steps, leg)
+        progress_bar.empty()
+
+        return search.finish()
+
+    async def _try_osrm_alternatives(self, start: Location, end: Location, blockages: List[Blockage], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Try OSRM natural alternatives first"""
+        route_data = await self.get_reliable_route(start.lat, start.lon, end.lat, end.lon, budget=budget)
+
+        if route_data and route_data.get('multiple_routes'):
+            routes = route_data['routes']
+            conflicts_list = await asyncio.to_thread(self.engine._alternative_conflicts, start, end, routes, blockages)
+            return self.engine._select_osrm_alternative(start, end, routes, conflicts_list)
+
+        return None
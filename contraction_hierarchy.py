@@ -0,0 +1,371 @@
+"""
+Contraction Hierarchies over the offline road graph
+"""
+import heapq
+import math
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from road_graph import RoadGraph, DURATION_SCALE, find_overpass_extract, compiled_graph_path, load_road_graph, write_array_file, map_array_file, search_view, derived_file_is_current
+
+CH_MAGIC = b"RGCHIER1"
+CH_VERSION = 3
+CH_SUFFIX = ".ch"
+WITNESS_SETTLE_LIMIT = 60
+_SECTIONS = (
+    ('rank', np.int32, 'n'),
+    ('up_indptr', np.int32, 'n+1'),
+    ('up_indices', np.int32, 'up'),
+    ('up_weights', np.uint32, 'up'),
+    ('up_lengths', np.uint32, 'up'),
+    ('up_middle', np.int32, 'up'),
+    ('down_indptr', np.int32, 'n+1'),
+    ('down_indices', np.int32, 'down'),
+    ('down_weights', np.uint32, 'down'),
+    ('down_lengths', np.uint32, 'down'),
+    ('down_middle', np.int32, 'down'),
+)
+
+
+class ContractionHierarchy:
+    """
+    Node ranking plus the upward search graphs of a contracted road graph.
+
+    ``up_*`` holds, per node ``u``, edges ``u -> w`` with ``rank[w] > rank[u]``.
+    ``down_*`` holds, per node ``w``, the tails ``u`` of edges ``u -> w`` with
+    ``rank[u] > rank[w]``, i.e. the upward graph of the reversed network.
+    ``*_middle`` is the contracted node a shortcut bypasses, or -1 for an
+    original road edge. Weights and lengths are in the road graph's duration
+    and length units; a shortcut's length is that of the path it replaces.
+    """
+
+    def __init__(self, graph: RoadGraph, arrays: Dict[str, np.ndarray], backing=None):
+        self.graph = graph
+        for name, _, _ in _SECTIONS:
+            setattr(self, name, arrays[name])
+        self._backing = backing
+        self._lists = None
+        self._length_lists = None
+
+    @classmethod
+    def build(cls, graph: RoadGraph, settle_limit: int = WITNESS_SETTLE_LIMIT) -> "ContractionHierarchy":
+        """Contract nodes in lazy edge-difference order, adding shortcuts where no witness path exists"""
+        n = graph.node_count
+        indptr, indices, weights = graph.adjacency()
+        lengths = graph.length_dm.tolist()
+        unset = (math.inf, math.inf)
+
+        # Edge values are (duration, length) so parallel edges keep the fastest, then shortest
+        out_edges: List[Dict[int, Tuple[int, int]]] = [dict() for _ in range(n)]
+        in_edges: List[Dict[int, Tuple[int, int]]] = [dict() for _ in range(n)]
+        for u in range(n):
+            for edge in range(indptr[u], indptr[u + 1]):
+                w = indices[edge]
+                value = (weights[edge], lengths[edge])
+                if w != u and value < out_edges[u].get(w, unset):
+                    out_edges[u][w] = value
+                    in_edges[w][u] = value
+
+        middle: Dict[Tuple[int, int], int] = {}
+        contracted = bytearray(n)
+        deleted_neighbors = [0] * n
+        rank = np.zeros(n, dtype=np.int32)
+        up_rows: List[List[Tuple[int, int, int, int]]] = [[] for _ in range(n)]
+        down_rows: List[List[Tuple[int, int, int, int]]] = [[] for _ in range(n)]
+
+        def witness_distances(source: int, skip: int, max_cost: int) -> Dict[int, int]:
+            dist = {source: 0}
+            heap = [(0, source)]
+            settled = 0
+            while heap and settled < settle_limit:
+                cost, node = heapq.heappop(heap)
+                if cost > dist.get(node, math.inf):
+                    continue
+                if cost > max_cost:
+                    break
+                settled += 1
+                for neighbor, (weight, _) in out_edges[node].items():
+                    if neighbor == skip:
+                        continue
+                    new_cost = cost + weight
+                    if new_cost < dist.get(neighbor, math.inf):
+                        dist[neighbor] = new_cost
+                        heapq.heappush(heap, (new_cost, neighbor))
+            return dist
+
+        def needed_shortcuts(v: int) -> List[Tuple[int, int, Tuple[int, int]]]:
+            shortcuts = []
+            outs = out_edges[v]
+            if not outs:
+                return shortcuts
+            for u, (cost_in, length_in) in in_edges[v].items():
+                targets = {w: (cost_in + cost_out, length_in + length_out) for w, (cost_out, length_out) in outs.items() if w != u}
+                if not targets:
+                    continue
+                dist = witness_distances(u, v, max(value[0] for value in targets.values()))
+                for w, via in targets.items():
+                    if dist.get(w, math.inf) > via[0]:
+                        shortcuts.append((u, w, via))
+            return shortcuts
+
+        def priority(v: int) -> int:
+            edge_difference = len(needed_shortcuts(v)) - len(in_edges[v]) - len(out_edges[v])
+            return edge_difference + deleted_neighbors[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        level = 0
+
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+
+            # Lazy update: re-evaluate and requeue if the node is no longer the cheapest
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, w, value in needed_shortcuts(v):
+                if value < out_edges[u].get(w, unset):
+                    out_edges[u][w] = value
+                    in_edges[w][u] = value
+                    middle[(u, w)] = v
+
+            for w, (cost, length) in out_edges[v].items():
+                up_rows[v].append((w, cost, length, middle.get((v, w), -1)))
+                del in_edges[w][v]
+                deleted_neighbors[w] += 1
+            for u, (cost, length) in in_edges[v].items():
+                down_rows[v].append((u, cost, length, middle.get((u, v), -1)))
+                del out_edges[u][v]
+                deleted_neighbors[u] += 1
+
+            out_edges[v] = {}
+            in_edges[v] = {}
+            contracted[v] = 1
+            rank[v] = level
+            level += 1
+
+        arrays = {'rank': rank}
+        for prefix, rows in (('up', up_rows), ('down', down_rows)):
+            counts = np.array([len(row) for row in rows], dtype=np.int64)
+            row_indptr = np.zeros(n + 1, dtype=np.int32)
+            np.cumsum(counts, out=row_indptr[1:])
+            flat = [edge for row in rows for edge in row]
+            arrays[f'{prefix}_indptr'] = row_indptr
+            arrays[f'{prefix}_indices'] = np.array([e[0] for e in flat], dtype=np.int32)
+            arrays[f'{prefix}_weights'] = np.array([e[1] for e in flat], dtype=np.uint32)
+            arrays[f'{prefix}_lengths'] = np.array([e[2] for e in flat], dtype=np.uint32)
+            arrays[f'{prefix}_middle'] = np.array([e[3] for e in flat], dtype=np.int32)
+
+        return cls(graph, arrays)
+
+    def save(self, path: str):
+        graph_edges, graph_hash = self.graph.fingerprint()
+        write_array_file(path, CH_MAGIC, CH_VERSION,
+                         {'n': len(self.rank), 'up': len(self.up_indices), 'down': len(self.down_indices),
+                          'graph_edges': graph_edges, 'graph_hash': graph_hash},
+                         _SECTIONS, {name: getattr(self, name) for name, _, _ in _SECTIONS})
+
+    @classmethod
+    def load(cls, graph: RoadGraph, path: str) -> "ContractionHierarchy":
+        arrays, header, backing = map_array_file(path, CH_MAGIC, CH_VERSION, ('n', 'up', 'down', 'graph_edges', 'graph_hash'), _SECTIONS)
+        if len(arrays['rank']) != graph.node_count or (header['graph_edges'], header['graph_hash']) != graph.fingerprint():
+            del arrays  # the views pin the map; release them so it can close
+            backing.close()
+            raise ValueError(f"Hierarchy {path} does not match the road graph")
+        return cls(graph, arrays, backing)
+
+    def search_lists(self):
+        """Upward/downward CSR rows as ``search_view``s for the query loops"""
+        if self._lists is None:
+            self._lists = tuple(search_view(getattr(self, name)) for name in (
+                'up_indptr', 'up_indices', 'up_weights', 'up_middle',
+                'down_indptr', 'down_indices', 'down_weights', 'down_middle'
+            ))
+        return self._lists
+
+    def length_lists(self) -> Tuple[Sequence[int], Sequence[int]]:
+        """Upward and downward edge lengths as ``search_view``s"""
+        if self._length_lists is None:
+            self._length_lists = (search_view(self.up_lengths), search_view(self.down_lengths))
+        return self._length_lists
+
+    def upward_space(self, source: int, forward: bool = True) -> Dict[int, Tuple[int, int]]:
+        """Full upward Dijkstra from ``source``: (duration, length) to every node it reaches"""
+        up_ptr, up_idx, up_w, _, down_ptr, down_idx, down_w, _ = self.search_lists()
+        up_len, down_len = self.length_lists()
+        ptr, idx, weights, lengths = (up_ptr, up_idx, up_w, up_len) if forward else (down_ptr, down_idx, down_w, down_len)
+
+        dist = {source: (0, 0)}
+        heap = [(0, 0, source)]
+        while heap:
+            cost, length, node = heapq.heappop(heap)
+            if (cost, length) > dist[node]:
+                continue
+            for edge in range(ptr[node], ptr[node + 1]):
+                neighbor = idx[edge]
+                value = (cost + weights[edge], length + lengths[edge])
+                if value < dist.get(neighbor, (math.inf, math.inf)):
+                    dist[neighbor] = value
+                    heapq.heappush(heap, (value[0], value[1], neighbor))
+        return dist
+
+    def many_to_many(self, sources: List[int], targets: List[int]) -> Tuple[List[List[Optional[int]]], List[List[Optional[int]]]]:
+        """
+        Bucket many-to-many: one backward upward search per target fills
+        per-node buckets, then one forward upward search per source scans them.
+        Returns (durations, lengths) in graph units, None where unreachable.
+        """
+        buckets: Dict[int, List[Tuple[int, int, int]]] = {}
+        for j, target in enumerate(targets):
+            for node, (cost, length) in self.upward_space(target, forward=False).items():
+                buckets.setdefault(node, []).append((j, cost, length))
+
+        durations = [[None] * len(targets) for _ in sources]
+        lengths = [[None] * len(targets) for _ in sources]
+        for i, source in enumerate(sources):
+            row_durations, row_lengths = durations[i], lengths[i]
+            for node, (cost, length) in self.upward_space(source).items():
+                for j, target_cost, target_length in buckets.get(node, ()):
+                    total = cost + target_cost
+                    if row_durations[j] is None or total < row_durations[j]:
+                        row_durations[j] = total
+                        row_lengths[j] = length + target_length
+        return durations, lengths
+
+    def query(self, source: int, target: int) -> Optional[Dict]:
+        """Bidirectional upward search; returns unpacked node path and travel time"""
+        if source == target:
+            return {'nodes': [source], 'duration_s': 0.0, 'length_m': 0.0}
+
+        up_ptr, up_idx, up_w, up_mid, down_ptr, down_idx, down_w, down_mid = self.search_lists()
+
+        dist = ({source: 0}, {target: 0})
+        parent = ({source: (-1, -1)}, {target: (-1, -1)})
+        heaps = ([(0, source)], [(0, target)])
+        rows = ((up_ptr, up_idx, up_w), (down_ptr, down_idx, down_w))
+        best, meeting = math.inf, -1
+
+        while heaps[0] or heaps[1]:
+            # Alternate directions; a direction stops once its frontier can't improve the best meeting
+            for side in (0, 1):
+                heap = heaps[side]
+                if not heap:
+                    continue
+                if heap[0][0] >= best:
+                    heap.clear()
+                    continue
+                cost, node = heapq.heappop(heap)
+                if cost > dist[side][node]:
+                    continue
+
+                other = dist[1 - side].get(node)
+                if other is not None and cost + other < best:
+                    best, meeting = cost + other, node
+
+                ptr, idx, weights = rows[side]
+                for edge in range(ptr[node], ptr[node + 1]):
+                    neighbor = idx[edge]
+                    new_cost = cost + weights[edge]
+                    if new_cost < dist[side].get(neighbor, math.inf):
+                        dist[side][neighbor] = new_cost
+                        parent[side][neighbor] = (node, edge)
+                        heapq.heappush(heap, (new_cost, neighbor))
+
+        if meeting < 0:
+            return None
+
+        nodes = self._unpack_meeting(parent, meeting)
+        return {'nodes': nodes, 'duration_s': best / DURATION_SCALE, 'length_m': self.graph.path_length_m(nodes)}
+
+    def _unpack_meeting(self, parent, meeting: int) -> List[int]:
+        _, _, _, up_mid, _, _, _, down_mid = self.search_lists()
+
+        forward = []
+        node = meeting
+        while parent[0][node][0] != -1:
+            tail, edge = parent[0][node]
+            forward.append((tail, node, up_mid[edge]))
+            node = tail
+        forward.reverse()
+
+        backward = []
+        node = meeting
+        while parent[1][node][0] != -1:
+            head, edge = parent[1][node]
+            backward.append((node, head, down_mid[edge]))
+            node = head
+
+        nodes = [forward[0][0] if forward else meeting]
+        for tail, head, mid in forward + backward:
+            self._unpack_edge(tail, head, mid, nodes)
+        return nodes
+
+    def _unpack_edge(self, tail: int, head: int, mid: int, out: List[int]):
+        """Append the original nodes of edge tail->head (excluding tail) to ``out``"""
+        up_ptr, up_idx, up_w, up_mid, down_ptr, down_idx, down_w, down_mid = self.search_lists()
+        stack = [(tail, head, mid)]
+        while stack:
+            tail, head, mid = stack.pop()
+            if mid < 0:
+                out.append(head)
+                continue
+            # tail -> mid is stored at mid's downward row, mid -> head at mid's upward row
+            first = min((down_w[e], down_mid[e]) for e in range(down_ptr[mid], down_ptr[mid + 1]) if down_idx[e] == tail)
+            second = min((up_w[e], up_mid[e]) for e in range(up_ptr[mid], up_ptr[mid + 1]) if up_idx[e] == head)
+            stack.append((mid, head, second[1]))
+            stack.append((tail, mid, first[1]))
+
+
+def hierarchy_path(graph_path: str) -> str:
+    return os.path.splitext(graph_path)[0] + CH_SUFFIX
+
+
+_HIERARCHY_CACHE: Dict[Tuple[str, Tuple[int, int]], ContractionHierarchy] = {}
+_HIERARCHY_LOCK = threading.Lock()
+
+
+def load_contraction_hierarchy(graph: RoadGraph, extract_path: Optional[str] = None) -> Optional[ContractionHierarchy]:
+    """
+    Map the precomputed hierarchy for the bundled extract if one has been
+    compiled (``python contraction_hierarchy.py``) for this exact graph.
+    Building is deliberately never done on the request path.
+    """
+    extract_path = extract_path or find_overpass_extract()
+    if extract_path is None:
+        return None
+
+    path = hierarchy_path(compiled_graph_path(extract_path))
+    key = (path, graph.fingerprint())
+    with _HIERARCHY_LOCK:
+        if key not in _HIERARCHY_CACHE:
+            if not derived_file_is_current(path, extract_path):
+                return None
+            try:
+                _HIERARCHY_CACHE[key] = ContractionHierarchy.load(graph, path)
+            except (OSError, ValueError):
+                return None
+        return _HIERARCHY_CACHE[key]
+
+
+if __name__ == "__main__":
+    import time
+
+    source = sys.argv[1] if len(sys.argv) > 1 else find_overpass_extract()
+    if source is None:
+        sys.exit("No Overpass extract found in cache/")
+
+    road_graph = load_road_graph(source)
+    started = time.perf_counter()
+    hierarchy = ContractionHierarchy.build(road_graph)
+    target = hierarchy_path(compiled_graph_path(source))
+    hierarchy.save(target)
+    print(f"Contracted {road_graph.node_count} nodes in {time.perf_counter() - started:.1f}s: "
+          f"{len(hierarchy.up_indices)} up / {len(hierarchy.down_indices)} down edges -> {target}")
@@ -1,11 +1,14 @@
 """
 Enhanced navigation system with robust avoidance
 """
-from optimized_routing import OptimizedRouteEngine, Location, Blockage
+from optimized_routing import OptimizedRouteEngine, RouteConflictTracker, Location, Blockage, _blockage_fingerprint
+from async_routing import AsyncOptimizedRouteEngine
+from spatial_index import BlockageGridIndex
 from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
 import streamlit as st
 import time
+import asyncio
 from typing import List, Optional, Dict
 
 class EnhancedNavigationSystem:
@@ -14,7 +17,10 @@ class EnhancedNavigationSystem:
     def __init__(self):
         self.route_engine = OptimizedRouteEngine()
         self.blockages: List[Blockage] = []
+        self.blockage_index = BlockageGridIndex()
+        self.conflict_tracker = RouteConflictTracker()
         self.cache = {}
+        self.async_route_engine: Optional[AsyncOptimizedRouteEngine] = None
         self.geocoder = Nominatim(user_agent="RouteOptimizer-Robust-v1.0")
     
     def geocode_location(self, location_name: str) -> Optional[Location]:
@@ -55,19 +61,85 @@ class EnhancedNavigationSystem:
         
         blockage = Blockage(lat, lon, radius, description)
         self.blockages.append(blockage)
+        self.blockage_index.insert(blockage)
+        self.conflict_tracker.add_blockage(blockage)
         st.success(f"✅ Added obstacle: {description} ({radius}m)")
     
+    def remove_blockage(self, idx: int):
+        """Remove a single blockage by position"""
+        if not (0 <= idx < len(self.blockages)):
+            return
+        
+        blockage = self.blockages.pop(idx)
+        self.blockage_index.remove(blockage)
+        self.conflict_tracker.remove_blockage(blockage)
+    
     def clear_blockages(self):
         """Clear all blockages"""
         self.blockages = []
+        self.blockage_index.clear()
+        self.conflict_tracker.clear_blockages()
         st.success("🧹 All obstacles cleared")
     
+    def _get_async_engine(self) -> AsyncOptimizedRouteEngine:
+        """Async engine sharing this system's cache and settings"""
+        if self.async_route_engine is None:
+            self.async_route_engine = AsyncOptimizedRouteEngine(self.route_engine)
+        return self.async_route_engine
+    
+    def route_conflicts(self, route: List) -> Dict:
+        """Conflicts of a route against the current obstacles, updated incrementally as obstacles change"""
+        return self.conflict_tracker.conflicts(route, self.blockage_index)
+    
+    def route_with_current_obstacles(self, route_result: Dict) -> Dict:
+        """
+        The calculated route as it stands against the current obstacles. Once they
+        differ from the ones it was planned for, a copy is returned with its
+        conflicts and every label derived from them re-computed, marked stale.
+        """
+        if not route_result.get('success') or not route_result.get('route'):
+            return route_result
+        if route_result.get('planned_obstacles') == _blockage_fingerprint(self.blockages):
+            return route_result
+        
+        conflicts = self.route_conflicts(route_result['route'])
+        service = route_result.get('service_used', 'Unknown')
+        refreshed = {**route_result, 'conflicts': conflicts, 'stale': True, 'avoidance_success': not conflicts['has_conflicts']}
+        
+        if 'strategy_name' not in route_result:
+            # Direct and fallback routes report their obstacle overlap as the impact
+            refreshed['blockage_impact'] = conflicts['conflict_percentage']
+        
+        if conflicts['has_conflicts']:
+            refreshed.update({
+                'route_type': f"🔴 Outdated Route - Obstacles Changed, Conflicts Found ({service})",
+                'warning': f"Obstacles changed: route now passes through {len(conflicts['conflict_points'])} obstacle areas - recalculate",
+                'danger_level': "HIGH"
+            })
+        else:
+            refreshed.update({
+                'route_type': f"⚪ Outdated Route - Obstacles Changed, Still Clear ({service})",
+                'warning': "Obstacles changed since this route was calculated - recalculate for the best route"
+            })
+            refreshed.pop('danger_level', None)
+        
+        return refreshed
+    
     def calculate_direct_route(self, start: Location, end: Location) -> Dict:
         """Calculate direct route without obstacles"""
         st.info("🛣️ Calculating direct route...")
         
         route_data = self.route_engine.get_reliable_route(start.lat, start.lon, end.lat, end.lon)
+        return self._build_direct_result(route_data)
+    
+    async def calculate_direct_route_async(self, start: Location, end: Location) -> Dict:
+        """Calculate direct route without obstacles on the running event loop"""
+        st.info("🛣️ Calculating direct route...")
         
+        route_data = await self._get_async_engine().get_reliable_route(start.lat, start.lon, end.lat, end.lon)
+        return self._build_direct_result(route_data)
+    
+    def _build_direct_result(self, route_data: Optional[Dict]) -> Dict:
         if not route_data or not route_data.get('success'):
             return {"success": False, "message": "Could not calculate direct route"}
         
@@ -81,7 +153,8 @@ class EnhancedNavigationSystem:
             "method": f"Direct routing via {route_data.get('service', 'routing service')}",
             "efficiency_score": 100.0,
             "blockage_impact": 0.0,
-            "service_used": route_data.get('service', 'Unknown')
+            "service_used": route_data.get('service', 'Unknown'),
+            "planned_obstacles": _blockage_fingerprint(self.blockages)
         }
     
     def calculate_optimal_route(self, start: Location, end: Location, show_direct: bool = False) -> Dict:
@@ -91,30 +164,63 @@ class EnhancedNavigationSystem:
         
         direct_route = self.calculate_direct_route(start, end)
         
-        if not direct_route["success"]:
-            return direct_route
+        if not direct_route["success"] or show_direct or not self.blockages:
+            return self._build_unchecked_result(direct_route, show_direct)
 
-        if show_direct or not self.blockages:
-            if show_direct:
-                direct_route["route_type"] = f"🟢 Direct Route - Obstacles Ignored ({direct_route.get('service_used', 'Unknown')})"
-            return direct_route
+        st.info("🔍 Analyzing route for obstacles...")
+        conflicts = self.route_conflicts(direct_route['route'])
+        
+        if not conflicts['has_conflicts']:
+            return self._build_safe_direct_result(direct_route, conflicts)
+
+        self._report_direct_conflicts(conflicts)
+        avoidance_route = self.route_engine.find_optimal_avoidance_route(start, end, self.blockage_index)
+        
+        return self._build_avoidance_result(direct_route, conflicts, avoidance_route)
+    
+    async def calculate_optimal_route_async(self, start: Location, end: Location, show_direct: bool = False) -> Dict:
+        """Calculate optimal route with strong obstacle avoidance without blocking the event loop"""
+        if not start or not end:
+            return {"success": False, "message": "Invalid start or end location"}
+        
+        async_engine = self._get_async_engine()
+        blockages = self.blockage_index
+        direct_route = await self.calculate_direct_route_async(start, end)
+        
+        if not direct_route["success"] or show_direct or not blockages:
+            return self._build_unchecked_result(direct_route, show_direct)
 
         st.info("🔍 Analyzing route for obstacles...")
-        conflicts = self.route_engine.calculate_route_conflicts(direct_route['route'], self.blockages)
+        conflicts = await asyncio.to_thread(self.route_conflicts, direct_route['route'])
         
         if not conflicts['has_conflicts']:
-            st.success("✅ Direct route is completely safe!")
-            direct_route.update({
-                "route_type": f"🟢 Direct Route - Verified Safe ({direct_route.get('service_used', 'Unknown')})",
-                "conflicts": conflicts
-            })
-            return direct_route
+            return self._build_safe_direct_result(direct_route, conflicts)
 
+        self._report_direct_conflicts(conflicts)
+        avoidance_route = await async_engine.find_optimal_avoidance_route(start, end, blockages)
+        
+        return self._build_avoidance_result(direct_route, conflicts, avoidance_route)
+    
+    def _build_unchecked_result(self, direct_route: Dict, show_direct: bool) -> Dict:
+        if direct_route["success"] and show_direct:
+            direct_route["route_type"] = f"🟢 Direct Route - Obstacles Ignored ({direct_route.get('service_used', 'Unknown')})"
+        return direct_route
+    
+    def _build_safe_direct_result(self, direct_route: Dict, conflicts: Dict) -> Dict:
+        st.success("✅ Direct route is completely safe!")
+        direct_route.update({
+            "route_type": f"🟢 Direct Route - Verified Safe ({direct_route.get('service_used', 'Unknown')})",
+            "conflicts": conflicts
+        })
+        return direct_route
+    
+    def _report_direct_conflicts(self, conflicts: Dict):
         conflict_pct = conflicts['conflict_percentage']
         st.error(f"🚨 MAJOR CONFLICT DETECTED: {conflict_pct:.1f}% of route passes through obstacles!")
         st.info("🛠️ Generating strong avoidance route...")
-
-        avoidance_route = self.route_engine.find_optimal_avoidance_route(start, end, self.blockages)
+    
+    def _build_avoidance_result(self, direct_route: Dict, conflicts: Dict, avoidance_route: Optional[Dict]) -> Dict:
+        conflict_pct = conflicts['conflict_percentage']
         
         if avoidance_route:
             avoidance_conflicts = avoidance_route.get('conflicts', {})
@@ -145,7 +251,8 @@ class EnhancedNavigationSystem:
                 "original_duration": direct_route['estimated_time_minutes'],
                 "strategy_name": avoidance_route['strategy_name'],
                 "service_used": avoidance_route.get('service', 'Unknown'),
-                "avoidance_success": not avoidance_route['conflicts'].get('has_conflicts', True)
+                "avoidance_success": not avoidance_route['conflicts'].get('has_conflicts', True),
+                "planned_obstacles": _blockage_fingerprint(self.blockages)
             }
 
         st.error("❌ CRITICAL: Could not find any viable avoidance route!")
@@ -165,5 +272,6 @@ class EnhancedNavigationSystem:
             "warning": f"CRITICAL: Route passes through {len(conflicts['conflict_points'])} obstacle areas",
             "service_used": direct_route.get('service_used', 'Unknown'),
             "avoidance_success": False,
-            "danger_level": "HIGH"
+            "danger_level": "HIGH",
+            "planned_obstacles": _blockage_fingerprint(self.blockages)
         }
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Pooled HTTP transport for routing service calls
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledTransport:
+    """Keep-alive HTTP client with per-host connection pools, retries and latency stats"""
+
+    def __init__(self, pool_size: int = 10, max_hosts: int = 4, retries: int = 2,
+                 backoff_factor: float = 0.3, headers: Optional[Dict[str, str]] = None,
+                 latency_window: int = 500):
+        self.pool_size = pool_size
+        self.session = requests.Session()
+
+        # A read timeout means the server is hung; retrying it would multiply the
+        # full timeout, so only refused connections and 429/5xx answers are retried.
+        retry_policy = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False
+        )
+
+        # urllib3 keeps one pool per (scheme, host, port); pool_connections bounds how
+        # many host pools stay cached, pool_maxsize bounds keep-alive sockets per host.
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size, max_retries=retry_policy)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.session.headers.update(headers or {
+            'User-Agent': 'ComprehensiveRouteOptimizer/1.0',
+            'Accept': 'application/json'
+        })
+
+        # Budgeted callers need exactly one attempt per charged call, so they get
+        # a twin session whose pools never retry or back off.
+        self.single_shot_session = requests.Session()
+        single_shot = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size, max_retries=0)
+        self.single_shot_session.mount("https://", single_shot)
+        self.single_shot_session.mount("http://", single_shot)
+        self.single_shot_session.headers.update(self.session.headers)
+
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=latency_window))
+        self._requests = defaultdict(int)
+        self._failures = defaultdict(int)
+
+    def get(self, url: str, params: Optional[Dict] = None, timeout: float = 15, retry: bool = True) -> requests.Response:
+        """GET through the pooled session, recording latency per host; ``retry=False`` makes a single attempt"""
+        host = urlsplit(url).netloc
+        session = self.session if retry else self.single_shot_session
+        started = time.perf_counter()
+
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except Exception:
+            with self._lock:
+                self._requests[host] += 1
+                self._failures[host] += 1
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._requests[host] += 1
+            self._latencies[host].append(elapsed_ms)
+            if response.status_code != 200:
+                self._failures[host] += 1
+
+        return response
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-host request counts and latency percentiles in milliseconds"""
+        with self._lock:
+            report = {}
+            for host, count in self._requests.items():
+                samples = sorted(self._latencies[host])
+                report[host] = {
+                    'requests': count,
+                    'failures': self._failures[host],
+                    'mean_ms': sum(samples) / len(samples) if samples else 0.0,
+                    'p50_ms': samples[len(samples) // 2] if samples else 0.0,
+                    'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0,
+                    'max_ms': samples[-1] if samples else 0.0
+                }
+            return report
+
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
+        self.single_shot_session.close()
@@ -0,0 +1,256 @@
+"""
+ALT (A*, landmarks, triangle inequality) routing over the offline road graph
+"""
+import heapq
+import math
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from road_graph import RoadGraph, DURATION_SCALE, find_overpass_extract, compiled_graph_path, load_road_graph, write_array_file, map_array_file, search_view, derived_file_is_current
+
+ALT_MAGIC = b"RGALT001"
+ALT_VERSION = 2
+ALT_SUFFIX = ".alt"
+DEFAULT_LANDMARKS = 16
+ACTIVE_LANDMARKS = 4
+UNREACHABLE = np.iinfo(np.uint32).max
+_SECTIONS = (
+    ('landmarks', np.int32, 'k'),
+    ('dist_from', np.uint32, 'kn'),
+    ('dist_to', np.uint32, 'kn'),
+)
+
+
+def _dijkstra_all(indptr: Sequence[int], heads: Sequence[int], weights: Sequence[int], source: int, n: int) -> List[float]:
+    """Travel time from ``source`` to every node (math.inf when unreachable)"""
+    dist = [math.inf] * n
+    dist[source] = 0
+    heap = [(0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > dist[node]:
+            continue
+        for edge in range(indptr[node], indptr[node + 1]):
+            neighbor = heads[edge]
+            new_cost = cost + weights[edge]
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                heapq.heappush(heap, (new_cost, neighbor))
+    return dist
+
+
+def _as_table_row(dist: List[float]) -> np.ndarray:
+    row = np.array(dist, dtype=float)
+    row[~np.isfinite(row)] = UNREACHABLE
+    return row.astype(np.uint32)
+
+
+class LandmarkIndex:
+    """
+    Landmark distance tables for goal-directed A*.
+
+    ``dist_from[i, v]`` is the travel time from landmark ``i`` to ``v`` and
+    ``dist_to[i, v]`` the time from ``v`` back to it. By the triangle
+    inequality both give lower bounds on any ``v -> t`` distance, and those
+    bounds stay valid when edges are closed, since closing only lengthens paths.
+    """
+
+    def __init__(self, graph: RoadGraph, arrays: Dict[str, np.ndarray], backing=None):
+        self.graph = graph
+        count = len(arrays['landmarks'])
+        self.landmarks = arrays['landmarks']
+        self.dist_from = arrays['dist_from'].reshape(count, graph.node_count)
+        self.dist_to = arrays['dist_to'].reshape(count, graph.node_count)
+        self._backing = backing
+        self._rows: Dict[int, tuple] = {}
+        self._rows_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, graph: RoadGraph, count: int = DEFAULT_LANDMARKS) -> "LandmarkIndex":
+        """Pick landmarks with the farthest heuristic and compute their distance tables"""
+        n = graph.node_count
+        indptr, indices, durations = graph.adjacency()
+        rev_indptr, rev_sources, rev_edges = graph.reverse_adjacency()
+        rev_weights = [durations[edge] for edge in rev_edges]
+        routable = np.flatnonzero(graph.routable_mask())
+
+        # Seed: the node farthest from an arbitrary routable node
+        seed = _as_table_row(_dijkstra_all(indptr, indices, durations, int(routable[0]), n))
+        landmarks = [int(routable[np.argmax(seed[routable])])]
+        dist_from, dist_to = [], []
+        spread = np.full(n, np.inf)
+
+        while True:
+            landmark = landmarks[-1]
+            dist_from.append(_as_table_row(_dijkstra_all(indptr, indices, durations, landmark, n)))
+            dist_to.append(_as_table_row(_dijkstra_all(rev_indptr, rev_sources, rev_weights, landmark, n)))
+            if len(landmarks) == count:
+                break
+
+            # Next landmark: the routable node farthest (round trip) from all chosen ones
+            round_trip = dist_from[-1].astype(np.float64) + dist_to[-1]
+            spread = np.minimum(spread, round_trip)
+            candidates = spread[routable]
+            candidates[np.isin(routable, landmarks)] = -1
+            landmarks.append(int(routable[np.argmax(candidates)]))
+
+        arrays = {
+            'landmarks': np.array(landmarks, dtype=np.int32),
+            'dist_from': np.concatenate(dist_from),
+            'dist_to': np.concatenate(dist_to)
+        }
+        return cls(graph, arrays)
+
+    def save(self, path: str):
+        graph_edges, graph_hash = self.graph.fingerprint()
+        write_array_file(path, ALT_MAGIC, ALT_VERSION,
+                         {'k': len(self.landmarks), 'kn': self.dist_from.size, 'graph_edges': graph_edges, 'graph_hash': graph_hash},
+                         _SECTIONS, {'landmarks': self.landmarks, 'dist_from': self.dist_from.ravel(), 'dist_to': self.dist_to.ravel()})
+
+    @classmethod
+    def load(cls, graph: RoadGraph, path: str) -> "LandmarkIndex":
+        arrays, header, backing = map_array_file(path, ALT_MAGIC, ALT_VERSION, ('k', 'kn', 'graph_edges', 'graph_hash'), _SECTIONS)
+        if (arrays['dist_from'].size != len(arrays['landmarks']) * graph.node_count
+                or (header['graph_edges'], header['graph_hash']) != graph.fingerprint()):
+            del arrays  # the views pin the map; release them so it can close
+            backing.close()
+            raise ValueError(f"Landmark tables {path} do not match the road graph")
+        return cls(graph, arrays, backing)
+
+    def lower_bound(self, source: int, target: int) -> float:
+        """Best landmark lower bound on the travel time source -> target, in deciseconds"""
+        best = 0
+        for i in range(len(self.landmarks)):
+            best = max(best, self._bound(i, source, target))
+        return best
+
+    def active_landmarks(self, source: int, target: int, count: int = ACTIVE_LANDMARKS) -> List[int]:
+        """Landmarks giving the tightest bounds for this pair; only these are used during the search"""
+        bounds = [(self._bound(i, source, target), i) for i in range(len(self.landmarks))]
+        bounds.sort(reverse=True)
+        return [i for bound, i in bounds[:count] if bound > 0]
+
+    def shortest_path(self, source: int, target: int, closed_edges: Optional[Sequence] = None) -> Optional[Dict]:
+        """
+        A* with landmark bounds. ``closed_edges`` is an optional edge-indexed
+        sequence (bytearray, bool array); edges with a truthy entry are skipped.
+        """
+        if source == target:
+            return {'nodes': [source], 'length_m': 0.0, 'duration_s': 0.0}
+
+        indptr, indices, durations = self.graph.adjacency()
+        terms = []
+        for i in self.active_landmarks(source, target):
+            from_row, to_row = self._lists(i)
+            if from_row[target] == UNREACHABLE or to_row[target] == UNREACHABLE:
+                continue
+            terms.append((from_row, to_row, from_row[target], to_row[target]))
+
+        def heuristic(node: int) -> int:
+            best = 0
+            for from_row, to_row, from_target, to_target in terms:
+                from_node, to_node = from_row[node], to_row[node]
+                if from_node != UNREACHABLE and from_target - from_node > best:
+                    best = from_target - from_node
+                if to_node != UNREACHABLE and to_node - to_target > best:
+                    best = to_node - to_target
+            return best
+
+        best = {source: 0}
+        parent = {source: -1}
+        heap = [(heuristic(source), 0, source)]
+        settled = set()
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if node == target:
+                break
+            settled.add(node)
+
+            for edge in range(indptr[node], indptr[node + 1]):
+                if closed_edges is not None and closed_edges[edge]:
+                    continue
+                neighbor = indices[edge]
+                new_cost = cost + durations[edge]
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    parent[neighbor] = node
+                    heapq.heappush(heap, (new_cost + heuristic(neighbor), new_cost, neighbor))
+        else:
+            return None
+
+        nodes = [target]
+        while parent[nodes[-1]] != -1:
+            nodes.append(parent[nodes[-1]])
+        nodes.reverse()
+
+        return {'nodes': nodes, 'length_m': self.graph.path_length_m(nodes), 'duration_s': best[target] / DURATION_SCALE}
+
+    def _bound(self, i: int, source: int, target: int) -> int:
+        from_source, from_target = int(self.dist_from[i, source]), int(self.dist_from[i, target])
+        to_source, to_target = int(self.dist_to[i, source]), int(self.dist_to[i, target])
+        best = 0
+        if UNREACHABLE not in (from_source, from_target):
+            best = max(best, from_target - from_source)
+        if UNREACHABLE not in (to_source, to_target):
+            best = max(best, to_source - to_target)
+        return best
+
+    def _lists(self, i: int) -> tuple:
+        # Views index far faster than NumPy rows inside the search loop and stay on the shared pages
+        with self._rows_lock:
+            if i not in self._rows:
+                self._rows[i] = (search_view(self.dist_from[i]), search_view(self.dist_to[i]))
+            return self._rows[i]
+
+
+def landmark_path(graph_path: str) -> str:
+    return os.path.splitext(graph_path)[0] + ALT_SUFFIX
+
+
+_LANDMARK_CACHE: Dict[Tuple[str, Tuple[int, int]], LandmarkIndex] = {}
+_LANDMARK_LOCK = threading.Lock()
+
+
+def load_landmark_index(graph: RoadGraph, extract_path: Optional[str] = None) -> Optional[LandmarkIndex]:
+    """
+    Map the landmark tables for the bundled extract if they have been
+    computed (``python landmarks.py``) for this exact graph; None otherwise.
+    """
+    extract_path = extract_path or find_overpass_extract()
+    if extract_path is None:
+        return None
+
+    path = landmark_path(compiled_graph_path(extract_path))
+    key = (path, graph.fingerprint())
+    with _LANDMARK_LOCK:
+        if key not in _LANDMARK_CACHE:
+            if not derived_file_is_current(path, extract_path):
+                return None
+            try:
+                _LANDMARK_CACHE[key] = LandmarkIndex.load(graph, path)
+            except (OSError, ValueError):
+                return None
+        return _LANDMARK_CACHE[key]
+
+
+if __name__ == "__main__":
+    import time
+
+    source = sys.argv[1] if len(sys.argv) > 1 else find_overpass_extract()
+    if source is None:
+        sys.exit("No Overpass extract found in cache/")
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LANDMARKS
+
+    road_graph = load_road_graph(source)
+    started = time.perf_counter()
+    index = LandmarkIndex.build(road_graph, count)
+    target = landmark_path(compiled_graph_path(source))
+    index.save(target)
+    print(f"Computed {len(index.landmarks)} landmark tables in {time.perf_counter() - started:.1f}s -> {target}")
@@ -1,12 +1,33 @@
-import requests
 import math
+import hashlib
+import threading
+import numpy as np
 import heapq
-from typing import List, Tuple, Optional, Dict, Set
-from geopy.distance import geodesic
+from typing import Iterator, List, Tuple, Optional, Dict, Set
 import streamlit as st
 import time
 import itertools
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from route_cache import RouteCache
+from http_transport import PooledTransport
+from spatial_index import BlockageGridIndex
+from road_graph import OfflineRouter, load_road_graph
+from contraction_hierarchy import load_contraction_hierarchy
+from landmarks import load_landmark_index
+from geo_distance import EARTH_RADIUS_M, distance_km, distance_m, distance_m_batch
+
+CONFLICT_BUFFER_M = 150
+# Score bounds treat a chain's straight-line length as a lower bound on its road
+# length. Routes are measured from the snapped start/end, so each endpoint may
+# cut up to its snap offset off that length (this default is assumed when there
+# is no road graph to measure it on); the spherical model adds <0.5%.
+SNAP_TOLERANCE_M = 250
+SPHERICAL_ERROR_MARGIN = 0.995
+OSRM_TABLE_MAX_COORDINATES = 100
+CLEAR_CHECK_CHUNK = 256
+HIT_COLUMNS = ('segment', 'blockage', 't_enter', 't_exit', 't_closest', 'distance')
+METERS_PER_DEGREE_LAT = EARTH_RADIUS_M * math.pi / 180
 
 class Location:
     def __init__(self, lat: float, lon: float, name: str = ""):
@@ -21,6 +42,294 @@ class Blockage:
         self.radius = radius
         self.description = description
 
+def _segment_lengths_m(points: np.ndarray) -> np.ndarray:
+    return distance_m_batch(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+
+def _segment_circle_hits(points: np.ndarray, index: BlockageGridIndex, buffer_m: float, positions: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Exact intersection of every route segment with every nearby blockage circle
+    (radius + buffer_m), solved in a local equirectangular projection centred on
+    the blockage. Returns one row per intersecting (segment, blockage) pair with
+    the clipped parameter interval [t_enter, t_exit] and the closest approach.
+    Restrict to specific blockages by passing their index ``positions``.
+    """
+    columns = {name: [] for name in HIT_COLUMNS}
+    
+    if len(points) >= 2 and len(index) > 0:
+        point_a = points[:-1]
+        point_b = points[1:]
+        midpoints = (point_a + point_b) / 2
+        half_lengths = _segment_lengths_m(points) / 2
+        
+        # A blockage can only touch a segment if its circle comes within half the
+        # segment length of the midpoint; short segments share one cell lookup.
+        short = half_lengths <= index.cell_size_m / 2
+        groups = []
+        short_ids = np.flatnonzero(short)
+        for local_ids, cell_positions in index.candidate_groups(midpoints[short_ids, 0], midpoints[short_ids, 1],
+                                                                 buffer_m + index.cell_size_m / 2):
+            groups.append((short_ids[local_ids], cell_positions))
+        for seg in np.flatnonzero(~short):
+            seg_positions = index.query_positions(midpoints[seg, 0], midpoints[seg, 1], buffer_m + half_lengths[seg])
+            if len(seg_positions):
+                groups.append((np.array([seg]), seg_positions))
+        
+        for seg_ids, cell_positions in groups:
+            if positions is not None:
+                cell_positions = cell_positions[np.isin(cell_positions, positions)]
+                if len(cell_positions) == 0:
+                    continue
+            
+            b_lat = index.lats[cell_positions][None, :]
+            b_lon = index.lons[cell_positions][None, :]
+            reach = index.radii[cell_positions][None, :] + buffer_m
+            
+            kx = np.cos(np.radians(b_lat)) * METERS_PER_DEGREE_LAT
+            x0 = (point_a[seg_ids, 1, None] - b_lon) * kx
+            y0 = (point_a[seg_ids, 0, None] - b_lat) * METERS_PER_DEGREE_LAT
+            dx = (point_b[seg_ids, 1, None] - point_a[seg_ids, 1, None]) * kx
+            dy = (point_b[seg_ids, 0, None] - point_a[seg_ids, 0, None]) * METERS_PER_DEGREE_LAT
+            
+            qa = dx * dx + dy * dy
+            qb = x0 * dx + y0 * dy
+            qc = x0 * x0 + y0 * y0 - reach * reach
+            
+            safe_qa = np.where(qa > 0, qa, 1.0)
+            t_closest = np.where(qa > 0, np.clip(-qb / safe_qa, 0.0, 1.0), 0.0)
+            closest = np.hypot(x0 + t_closest * dx, y0 + t_closest * dy)
+            
+            # |P0 + t d|^2 = r^2  ->  qa t^2 + 2 qb t + qc = 0
+            root = np.sqrt(np.maximum(qb * qb - qa * qc, 0.0))
+            t_enter = np.where(qa > 0, np.clip((-qb - root) / safe_qa, 0.0, 1.0), 0.0)
+            t_exit = np.where(qa > 0, np.clip((-qb + root) / safe_qa, 0.0, 1.0), 1.0)
+            
+            hit_rows, hit_cols = np.nonzero(closest <= reach)
+            columns['segment'].append(seg_ids[hit_rows])
+            columns['blockage'].append(cell_positions[hit_cols])
+            columns['t_enter'].append(t_enter[hit_rows, hit_cols])
+            columns['t_exit'].append(t_exit[hit_rows, hit_cols])
+            columns['t_closest'].append(t_closest[hit_rows, hit_cols])
+            columns['distance'].append(closest[hit_rows, hit_cols])
+    
+    if not columns['segment']:
+        return _empty_hits()
+    return {name: np.concatenate(values) for name, values in columns.items()}
+
+def _empty_hits() -> Dict[str, np.ndarray]:
+    return {name: np.zeros(0, dtype=np.int64 if name in ('segment', 'blockage') else float) for name in HIT_COLUMNS}
+
+def _clear_conflict_report(points: np.ndarray) -> Dict:
+    """Full-shape report for a route already known to be conflict-free"""
+    return _summarize_conflicts(points, _segment_lengths_m(points), _empty_hits(), [])
+
+def _summarize_conflicts(points: np.ndarray, segment_lengths: np.ndarray, hits: Dict[str, np.ndarray], blockages: List[Blockage]) -> Dict:
+    """Build the conflict report from (segment, blockage) intersection rows"""
+    total_route_length = float(segment_lengths.sum())
+    
+    # Sort by segment, then blockage order, so the first row of a segment names its first blockage
+    order = np.lexsort((hits['blockage'], hits['segment']))
+    segment = hits['segment'][order]
+    t_enter = hits['t_enter'][order]
+    t_exit = hits['t_exit'][order]
+    
+    # Union of the conflicting sub-intervals per segment: offset each segment by 2
+    # so a single running maximum never leaks across segments.
+    conflict_length = 0.0
+    if len(segment):
+        interval_order = np.lexsort((t_enter, segment))
+        start = segment[interval_order] * 2.0 + t_enter[interval_order]
+        stop = segment[interval_order] * 2.0 + t_exit[interval_order]
+        reached = np.maximum.accumulate(stop)
+        previous = np.concatenate(([-np.inf], reached[:-1]))
+        covered = np.maximum(0.0, stop - np.maximum(start, previous))
+        conflict_length = float((covered * segment_lengths[segment[interval_order]]).sum())
+    
+    conflict_points = []
+    if len(segment):
+        firsts = np.concatenate(([0], np.flatnonzero(np.diff(segment)) + 1))
+        for row in order[firsts]:
+            seg = int(hits['segment'][row])
+            t = float(hits['t_closest'][row])
+            conflict_points.append({
+                'index': seg,
+                'point': (float(points[seg, 0] + (points[seg + 1, 0] - points[seg, 0]) * t),
+                          float(points[seg, 1] + (points[seg + 1, 1] - points[seg, 1]) * t)),
+                'blockage': blockages[int(hits['blockage'][row])],
+                'distance_to_center': float(hits['distance'][row])
+            })
+    
+    conflict_percentage = (conflict_length / total_route_length * 100) if total_route_length > 0 else 0
+    
+    return {
+        'has_conflicts': len(conflict_points) > 0,
+        'conflict_points': conflict_points,
+        'conflict_percentage': min(conflict_percentage, 100.0),
+        'total_points': len(points),
+        'conflict_length': conflict_length,
+        'total_length': total_route_length
+    }
+
+class RouteConflictTracker:
+    """
+    Caches conflict contributions per (route, blockage) pair so that adding or
+    removing one blockage only computes that blockage's intersections; the
+    aggregate report is re-derived from the cached rows.
+    """
+    
+    def __init__(self, max_routes: int = 32):
+        self.max_routes = max_routes
+        self._routes: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def conflicts(self, route: List[Tuple[float, float]], blockages: List[Blockage]) -> Dict:
+        """Conflict report for the route against the current blockage set"""
+        if not route or not blockages:
+            return {'has_conflicts': False, 'conflict_points': [], 'conflict_percentage': 0.0}
+        
+        index = BlockageGridIndex.ensure(blockages)
+        
+        with self._lock:
+            entry = self._entry(route)
+            contributions = entry['contributions']
+            
+            current = set(index.blockages)
+            for stale in [b for b in contributions if b not in current]:
+                del contributions[stale]
+            
+            missing = np.array([pos for pos, b in enumerate(index.blockages) if b not in contributions], dtype=np.int64)
+            if len(missing):
+                self._add_contributions(entry, index, missing)
+            
+            return self._aggregate(entry, index.blockages)
+    
+    def add_blockage(self, blockage: Blockage):
+        """Compute the new blockage's contribution for every tracked route"""
+        with self._lock:
+            single = BlockageGridIndex([blockage])
+            for entry in self._routes.values():
+                self._add_contributions(entry, single, np.array([0], dtype=np.int64))
+    
+    def remove_blockage(self, blockage: Blockage):
+        """Drop the blockage's contribution from every tracked route"""
+        with self._lock:
+            for entry in self._routes.values():
+                entry['contributions'].pop(blockage, None)
+    
+    def clear_blockages(self):
+        with self._lock:
+            for entry in self._routes.values():
+                entry['contributions'].clear()
+    
+    def _entry(self, route: List[Tuple[float, float]]) -> Dict:
+        points = np.asarray(route, dtype=float).reshape(-1, 2)
+        key = hashlib.sha1(points.tobytes()).hexdigest()
+        
+        entry = self._routes.get(key)
+        if entry is None:
+            entry = {
+                'points': points,
+                'segment_lengths': _segment_lengths_m(points),
+                'contributions': {}
+            }
+            self._routes[key] = entry
+            while len(self._routes) > self.max_routes:
+                self._routes.popitem(last=False)
+        else:
+            self._routes.move_to_end(key)
+        
+        return entry
+    
+    def _add_contributions(self, entry: Dict, index: BlockageGridIndex, positions: np.ndarray):
+        hits = _segment_circle_hits(entry['points'], index, CONFLICT_BUFFER_M, positions)
+        for pos in positions:
+            rows = hits['blockage'] == pos
+            entry['contributions'][index[int(pos)]] = {name: values[rows] for name, values in hits.items()}
+    
+    def _aggregate(self, entry: Dict, blockages: List[Blockage]) -> Dict:
+        parts = []
+        for pos, blockage in enumerate(blockages):
+            rows = entry['contributions'][blockage]
+            if len(rows['segment']):
+                parts.append({**rows, 'blockage': np.full(len(rows['segment']), pos, dtype=np.int64)})
+        
+        hits = {name: np.concatenate([part[name] for part in parts]) for name in HIT_COLUMNS} if parts else _empty_hits()
+        
+        return _summarize_conflicts(entry['points'], entry['segment_lengths'], hits, blockages)
+
+def _blockage_fingerprint(blockages: List[Blockage]) -> str:
+    """Key of a blockage list's geometry; order counts, as hit rows and waypoint names refer to blockages by position"""
+    rows = [(round(b.lat, 6), round(b.lon, 6), round(float(b.radius), 1)) for b in blockages]
+    return hashlib.sha1(repr(rows).encode("utf-8")).hexdigest()
+
+_NETWORK_CACHE: "OrderedDict[Tuple, List[PathNode]]" = OrderedDict()
+_NETWORK_CACHE_SIZE = 32
+_NETWORK_LOCK = threading.Lock()
+
+def _leg_key(start: Tuple[float, float], end: Tuple[float, float]) -> Tuple[float, float, float, float]:
+    return (round(start[0], 5), round(start[1], 5), round(end[0], 5), round(end[1], 5))
+
+class LegCache:
+    """
+    In-memory LRU of single-leg routes (start->wp, wp->wp, wp->end) and their
+    intersection rows against the current blockage set, so multi-waypoint
+    candidates can be stitched from legs instead of requested as whole chains.
+    """
+    
+    def __init__(self, max_legs: int = 4096):
+        self.max_legs = max_legs
+        self._legs: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._fetching: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, start: Tuple[float, float], end: Tuple[float, float]) -> Optional[Dict]:
+        with self._lock:
+            entry = self._legs.get(_leg_key(start, end))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._legs.move_to_end(_leg_key(start, end))
+            self.hits += 1
+            return entry['route_data']
+    
+    def put(self, start: Tuple[float, float], end: Tuple[float, float], route_data: Dict):
+        points = np.asarray(route_data['route'], dtype=float).reshape(-1, 2)
+        with self._lock:
+            self._legs[_leg_key(start, end)] = {
+                'route_data': route_data,
+                'points': points,
+                'segment_lengths': _segment_lengths_m(points),
+                'rows': (None, None)
+            }
+            self._fetching.pop(_leg_key(start, end), None)
+            while len(self._legs) > self.max_legs:
+                self._legs.popitem(last=False)
+    
+    def fetch_lock(self, start: Tuple[float, float], end: Tuple[float, float]) -> threading.Lock:
+        """Lock held while one leg is fetched, so chains sharing it in flight request it once"""
+        with self._lock:
+            return self._fetching.setdefault(_leg_key(start, end), threading.Lock())
+    
+    def leg_hits(self, start: Tuple[float, float], end: Tuple[float, float], index: BlockageGridIndex, fingerprint: str) -> Optional[Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]]:
+        """(points, segment_lengths, intersection rows) for a cached leg, computing the rows once per blockage set"""
+        with self._lock:
+            entry = self._legs.get(_leg_key(start, end))
+        if entry is None:
+            return None
+        
+        rows_fingerprint, hits = entry['rows']
+        if rows_fingerprint != fingerprint:
+            hits = _segment_circle_hits(entry['points'], index, CONFLICT_BUFFER_M)
+            entry['rows'] = (fingerprint, hits)
+        
+        return entry['points'], entry['segment_lengths'], hits
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {'legs': len(self._legs), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
 class PathNode:
     def __init__(self, lat: float, lon: float, node_type: str = "waypoint", name: str = ""):
         self.lat = lat
@@ -30,7 +339,7 @@ class PathNode:
         self.id = f"{lat:.6f},{lon:.6f}"
     
     def distance_to(self, other) -> float:
-        return geodesic((self.lat, self.lon), (other.lat, other.lon)).kilometers
+        return distance_km((self.lat, self.lon), (other.lat, other.lon))
     
     def __lt__(self, other):
         return self.id < other.id
@@ -68,77 +377,548 @@ class RoutePath:
         self.efficiency_score = efficiency
         return score
 
+def _optimistic_score(distance_km: float, direct_distance: float) -> float:
+    """Upper bound on the score of any route at least this long: conflict-free at exactly that length"""
+    path = RoutePath([], distance_km, {'has_conflicts': False}, [])
+    return path.calculate_score(direct_distance)
+
+def _optimistic_conflict_score(distance_km: float, direct_distance: float) -> float:
+    """Upper bound on the score of a route known to conflict: as if its conflict share were zero"""
+    path = RoutePath([], distance_km, {'has_conflicts': True, 'conflict_percentage': 0.0}, [])
+    return path.calculate_score(direct_distance)
+
+class SearchBudget:
+    """Wall-clock deadline and upstream-call allowance shared by every fetch of one search"""
+    
+    def __init__(self, deadline_ms: Optional[float] = None, max_upstream_calls: Optional[int] = None):
+        self.deadline = time.perf_counter() + deadline_ms / 1000 if deadline_ms is not None else None
+        self.max_upstream_calls = max_upstream_calls
+        self.upstream_calls = 0
+        self._lock = threading.Lock()
+    
+    def remaining_s(self) -> Optional[float]:
+        """Seconds left before the deadline (None without one)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+    
+    @property
+    def limited(self) -> bool:
+        return self.deadline is not None or self.max_upstream_calls is not None
+    
+    def expired(self) -> bool:
+        """Deadline passed; local stages check this before starting"""
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+    
+    def exhausted_reason(self) -> Optional[str]:
+        if self.expired():
+            return "deadline reached"
+        if self.max_upstream_calls is not None and self.upstream_calls >= self.max_upstream_calls:
+            return "upstream call limit reached"
+        return None
+    
+    def acquire_call(self) -> bool:
+        """Charge one upstream request; False once the budget is spent"""
+        with self._lock:
+            if self.exhausted_reason():
+                return False
+            self.upstream_calls += 1
+            return True
+    
+    def timeout(self, default: float) -> float:
+        """Per-request timeout clipped to the time left"""
+        remaining = self.remaining_s()
+        return default if remaining is None else max(0.001, min(default, remaining))
+
+class AvoidanceSearch:
+    """Best-so-far bookkeeping for one avoidance search, shared by the sync and async loops"""
+    
+    def __init__(self, start: Location, end: Location, total_candidates: int, budget: Optional[SearchBudget] = None, accept_detour_ratio: Optional[float] = None,
+                 snap_tolerance_km: float = 2 * SNAP_TOLERANCE_M / 1000, waypoints_snapped: bool = False):
+        self.direct_distance = distance_km((start.lat, start.lon), (end.lat, end.lon))
+        self.total_candidates = total_candidates
+        self.snap_tolerance_km = snap_tolerance_km
+        self.waypoints_snapped = waypoints_snapped
+        self.budget = budget
+        self.accept_detour_ratio = accept_detour_ratio
+        self.stop_reason = None
+        self.best_path = None
+        self.best_score = -1
+        self.best_index = None
+        self.paths_tested = 0
+        self.valid_paths = 0
+        self.pruned = 0
+        self._coverage = None
+    
+    def record(self, index: int, path_combo: Dict, evaluation: Optional[Dict]):
+        """Score a finished candidate; ties go to the earlier candidate so arrival order doesn't matter"""
+        self.paths_tested += 1
+        
+        if not evaluation:
+            return
+        
+        route_data = evaluation['route_data']
+        conflicts = evaluation['conflicts']
+        
+        if conflicts is None:
+            # Screened as conflicting and provably unable to win; no full report was built
+            st.info(f"⚠️ Path {self.paths_tested}: {path_combo['name']} - Conflicts detected (screened out)")
+            return
+        
+        path = RoutePath(
+            nodes=[], 
+            total_distance=route_data['distance'],
+            conflicts=conflicts,
+            route_points=route_data['route']
+        )
+        
+        direct_distance = self.direct_distance
+        score = path.calculate_score(direct_distance)
+        
+        if not conflicts.get('has_conflicts'):
+            self.valid_paths += 1
+            st.success(f"✅ Valid path {self.valid_paths}: {path_combo['name']} - Score: {score:.1f}")
+        else:
+            st.info(f"⚠️ Path {self.paths_tested}: {path_combo['name']} - Conflicts: {conflicts['conflict_percentage']:.1f}%")
+        
+        if score > self.best_score or (score == self.best_score and self.best_index is not None and index < self.best_index):
+            self.best_score = score
+            self.best_index = index
+            self.best_path = {
+                **route_data,
+                'conflicts': conflicts,
+                'strategy_name': path_combo['name'],
+                'efficiency_score': path.efficiency_score,
+                'distance_impact': ((route_data['distance'] - direct_distance) / direct_distance) * 100 if direct_distance > 0 else 0,
+                'waypoints': path_combo['waypoints']
+            }
+            
+            st.info(f"🏆 New best path: {path_combo['name']} (Score: {score:.1f})")
+    
+    def needs_report(self, index: int, evaluation: Optional[Dict]) -> bool:
+        """Whether a screened-as-conflicting candidate could still win and needs its full conflict report"""
+        if not evaluation or evaluation['conflicts'] is not None:
+            return False
+        
+        bound = _optimistic_conflict_score(evaluation['route_data']['distance'], self.direct_distance)
+        if self.best_index is None:
+            return True
+        return bound > self.best_score or (bound == self.best_score and index < self.best_index)
+    
+    def prune(self, index: int, path_combo: Dict) -> bool:
+        """
+        Skip a candidate whose straight-line length, less the endpoint snap
+        tolerance, already caps its score below the best so far. Waypoints off
+        the road could shorten a chain by up to twice their offset, so chains
+        through them are only pruned once the network was snapped onto roads.
+        """
+        if self.best_index is None or (path_combo['waypoints'] and not self.waypoints_snapped):
+            return False
+        
+        lower_bound_km = path_combo['estimated_distance'] * SPHERICAL_ERROR_MARGIN - self.snap_tolerance_km
+        if lower_bound_km <= 0:
+            return False
+        
+        bound = _optimistic_score(lower_bound_km, self.direct_distance)
+        if bound > self.best_score or (bound == self.best_score and index < self.best_index):
+            return False
+        
+        self.pruned += 1
+        return True
+    
+    @property
+    def candidates_done(self) -> int:
+        return self.paths_tested + self.pruned
+    
+    def report_coverage(self, done: int, total: int):
+        """Override candidate-based coverage for searches that count their work in other units"""
+        self._coverage = (done, total)
+    
+    def should_stop(self) -> bool:
+        """Anytime cut-off: budget spent, or a conflict-free route already within the accepted detour"""
+        if self.stop_reason is None:
+            if self.budget is not None:
+                self.stop_reason = self.budget.exhausted_reason()
+            
+            best_path = self.best_path
+            if (self.stop_reason is None and self.accept_detour_ratio is not None and best_path
+                    and not best_path['conflicts'].get('has_conflicts')
+                    and best_path['distance'] <= self.direct_distance * self.accept_detour_ratio):
+                self.stop_reason = f"route within {self.accept_detour_ratio:.2f}x of the straight-line bound found"
+        
+        return self.stop_reason is not None
+    
+    def record_failure(self, path_combo: Dict, error: Exception):
+        """Count a candidate whose evaluation raised"""
+        self.paths_tested += 1
+        st.warning(f"Path failed: {path_combo.get('name', 'Unknown')} - {str(error)}")
+    
+    def finish(self) -> Optional[Dict]:
+        """Report the outcome and return the best path found"""
+        best_path = self.best_path
+        done, total = self._coverage or (self.candidates_done, self.total_candidates)
+        coverage = 100.0
+        if self.stop_reason:
+            coverage = min(100.0, done / total * 100) if total else 0.0
+        
+        if self.pruned:
+            st.info(f"✂️ Pruned {self.pruned} candidates whose best possible score could not beat the best route (route calls skipped)")
+        
+        if self.stop_reason:
+            st.warning(f"⏱️ Search stopped early ({self.stop_reason}) after covering {coverage:.0f}% of candidates")
+        
+        if best_path:
+            best_path['total_paths_tested'] = self.paths_tested
+            best_path['valid_paths_found'] = self.valid_paths
+            best_path['exploration_completeness'] = coverage
+            best_path['pruned_candidates'] = self.pruned
+            best_path['stop_reason'] = self.stop_reason
+            best_path['upstream_calls'] = self.budget.upstream_calls if self.budget is not None else None
+            
+            st.balloons()
+            st.success(f"🎯 COMPREHENSIVE EXPLORATION COMPLETE!")
+            st.success(f"📊 Tested {self.paths_tested} paths, found {self.valid_paths} conflict-free options")
+            st.success(f"🏆 OPTIMAL PATH: {best_path['strategy_name']}")
+            st.success(f"⭐ Final Score: {self.best_score:.1f}, Efficiency: {best_path['efficiency_score']:.1f}%")
+        else:
+            st.error("❌ No valid paths found after comprehensive exploration")
+        
+        return best_path
+
 class OptimizedRouteEngine:
     """
     Comprehensive routing engine that explores ALL possible paths
     """
     
-    def __init__(self):
+    MAX_COMBINATIONS = 50
+    LOCAL_MAX_COMBINATIONS = 2000
+    PAIR_POOL_SIZE = 20
+    LOCAL_PAIR_POOL_SIZE = 60
+    PRESCREEN_POOL = 2000
+    PRESCREEN_DIJKSTRA_SOURCES = 8
+    MAX_CHAIN_WAYPOINTS = 3
+    MAX_WAYPOINT_DETOUR = 3.5
+    
+    def __init__(self, route_cache: Optional[RouteCache] = None, transport: Optional[PooledTransport] = None, max_in_flight: int = 8, local_routing: bool = False,
+                 search_strategy: str = "combinations"):
         self.routing_services = [
             "https://router.project-osrm.org",
             "http://router.project-osrm.org"
         ]
+        self.route_cache = route_cache if route_cache is not None else RouteCache()
+        self.transport = transport if transport is not None else PooledTransport(pool_size=max(10, max_in_flight))
+        self.max_in_flight = max_in_flight
+        self.local_routing = local_routing
+        self.search_strategy = search_strategy
+        self.leg_cache = LegCache()
+        self.offline_router: Optional[OfflineRouter] = None
+        self._offline_loaded = False
+        self._offline_lock = threading.Lock()
         
-    def get_reliable_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None) -> Optional[Dict]:
-        """Get route with waypoints if specified"""
+    def get_reliable_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None, alternatives: bool = True,
+                           budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Get route with waypoints if specified; with a spent budget only cached or local answers are given"""
         
-        if waypoints:
-            coords = f"{start_lon},{start_lat}"
-            for wp_lat, wp_lon in waypoints:
-                coords += f";{wp_lon},{wp_lat}"
-            coords += f";{end_lon},{end_lat}"
-        else:
-            coords = f"{start_lon},{start_lat};{end_lon},{end_lat}"
+        if self.local_routing:
+            local_route = self._route_offline(start_lat, start_lon, end_lat, end_lon, waypoints)
+            if local_route:
+                return local_route
+        
+        request = self._build_route_request(start_lat, start_lon, end_lat, end_lon, waypoints, alternatives)
+        data = self.route_cache.get(request['cache_key'])
+        refused = False
         
         #OSRM
-        for server in self.routing_services:
-            try:
-                url = f"{server}/route/v1/driving/{coords}"
-                params = {
-                    'overview': 'full',
-                    'geometries': 'geojson',
-                    'steps': 'false',
-                    'alternatives': 'true',
-                    'continue_straight': 'false'
-                }
-                
-                headers = {
-                    'User-Agent': 'ComprehensiveRouteOptimizer/1.0',
-                    'Accept': 'application/json'
-                }
-                
-                response = requests.get(url, params=params, headers=headers, timeout=15)
+        if data is None:
+            for server in self.routing_services:
+                if budget is not None and not budget.acquire_call():
+                    refused = True
+                    break
                 
-                if response.status_code == 200:
-                    data = response.json()
+                try:
+                    url = f"{server}/route/v1/driving/{request['coords']}"
                     
-                    if data.get('code') == 'Ok' and data.get('routes'):
-                        if not waypoints and len(data['routes']) > 1:
-                            return {
-                                'routes': data['routes'],
-                                'multiple_routes': True,
-                                'service': 'OSRM'
-                            }
-                        else:
-                            route_info = data['routes'][0]
-                            coordinates = route_info['geometry']['coordinates']
-                            route_points = [(coord[1], coord[0]) for coord in coordinates]
-                            
-                            return {
-                                'route': route_points,
-                                'distance': route_info['distance'] / 1000,
-                                'duration': route_info['duration'] / 60,
-                                'success': True,
-                                'service': 'OSRM'
-                            }
+                    response = self.transport.get(url, params=request['params'], timeout=budget.timeout(15) if budget else 15,
+                                                  retry=budget is None or not budget.limited)
+                    
+                    if response.status_code == 200:
+                        candidate = response.json()
                         
-            except Exception as e:
-                continue
+                        if candidate.get('code') == 'Ok' and candidate.get('routes'):
+                            data = candidate
+                            self.route_cache.put(request['cache_key'], data)
+                            break
+                            
+                except Exception as e:
+                    continue
+        
+        if data is not None:
+            return self._parse_route_response(data, waypoints)
+        
+        offline_route = self._route_offline(start_lat, start_lon, end_lat, end_lon, waypoints)
+        if offline_route:
+            return offline_route
+        
+        if refused:
+            return None
         
         return self._create_realistic_route(start_lat, start_lon, end_lat, end_lon, waypoints)
     
+    def get_leg(self, start: Tuple[float, float], end: Tuple[float, float], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Single-leg route, fetched once per engine and then served from the leg cache"""
+        route_data = self.leg_cache.get(start, end)
+        if route_data is None:
+            with self.leg_cache.fetch_lock(start, end):
+                route_data = self.leg_cache.get(start, end)
+                if route_data is None:
+                    route_data = self.get_reliable_route(start[0], start[1], end[0], end[1], alternatives=False, budget=budget)
+                    if not route_data or not route_data.get('success'):
+                        return None
+                    self.leg_cache.put(start, end, route_data)
+        return route_data
+    
+    def get_chain_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None,
+                        budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Route through the waypoints stitched from cached legs"""
+        points = self._chain_points(start_lat, start_lon, end_lat, end_lon, waypoints)
+        legs = []
+        for leg_start, leg_end in zip(points, points[1:]):
+            leg = self.get_leg(leg_start, leg_end, budget)
+            if leg is None:
+                return None
+            legs.append(leg)
+        
+        return self._stitch_legs(legs)
+    
+    def _chain_points(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None) -> List[Tuple[float, float]]:
+        return [(start_lat, start_lon)] + [tuple(wp) for wp in waypoints or []] + [(end_lat, end_lon)]
+    
+    def _stitch_legs(self, legs: List[Dict]) -> Dict:
+        """Concatenate leg geometries (dropping the repeated joint points) and sum their totals"""
+        route_points = list(legs[0]['route'])
+        for leg in legs[1:]:
+            route_points.extend(leg['route'][1:])
+        
+        services = {leg.get('service', 'Unknown') for leg in legs}
+        
+        return {
+            'route': route_points,
+            'distance': sum(leg['distance'] for leg in legs),
+            'duration': sum(leg['duration'] for leg in legs),
+            'success': True,
+            'service': services.pop() if len(services) == 1 else 'Mixed',
+            'legs': len(legs)
+        }
+    
+    def chain_conflicts(self, chain_points: List[Tuple[float, float]], blockages: List[Blockage]) -> Optional[Dict]:
+        """Conflict report of a stitched chain as the union of its legs' cached intersection rows"""
+        index = BlockageGridIndex.ensure(blockages)
+        fingerprint = _blockage_fingerprint(index.blockages)
+        
+        all_points, all_lengths, parts = [], [], []
+        offset = 0
+        for leg_start, leg_end in zip(chain_points, chain_points[1:]):
+            cached = self.leg_cache.leg_hits(leg_start, leg_end, index, fingerprint)
+            if cached is None:
+                return None
+            
+            points, segment_lengths, hits = cached
+            all_points.append(points if offset == 0 else points[1:])
+            all_lengths.append(segment_lengths)
+            parts.append({**hits, 'segment': hits['segment'] + offset})
+            offset += len(segment_lengths)
+        
+        hits = {name: np.concatenate([part[name] for part in parts]) for name in HIT_COLUMNS}
+        return _summarize_conflicts(np.concatenate(all_points), np.concatenate(all_lengths), hits, index.blockages)
+    
+    def _get_offline_router(self) -> Optional[OfflineRouter]:
+        """
+        Road graph router over the bundled Overpass extract, loaded on first use.
+        Every local stage (snapping, masking, offline routes and matrices) goes
+        through here, whatever ``local_routing`` says: the compiled graph is
+        memory-mapped, so only the one-off compile of a new extract costs time.
+        """
+        with self._offline_lock:
+            if not self._offline_loaded:
+                self._offline_loaded = True
+                try:
+                    graph = load_road_graph()
+                    if graph is not None:
+                        self.offline_router = OfflineRouter(
+                            graph,
+                            hierarchy=load_contraction_hierarchy(graph),
+                            landmarks=load_landmark_index(graph)
+                        )
+                except Exception:
+                    self.offline_router = None
+            return self.offline_router
+    
+    def _route_offline(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None) -> Optional[Dict]:
+        """Route on the local road graph when the online services are unreachable"""
+        router = self._get_offline_router()
+        if router is None:
+            return None
+        
+        try:
+            return router.route(start_lat, start_lon, end_lat, end_lon, waypoints)
+        except Exception:
+            return None
+    
+    def distance_matrix(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Travel time (minutes) and road distance (km) for every source/target pair in one call"""
+        if not sources or not targets:
+            return None
+        
+        # The offline matrix cannot be interrupted, so deadline-bound searches skip it
+        offline_allowed = budget is None or budget.deadline is None
+        
+        if self.local_routing and offline_allowed:
+            local_matrix = self._matrix_offline(sources, targets)
+            if local_matrix:
+                return local_matrix
+        
+        matrix = self._fetch_table(sources, targets, budget)
+        if matrix is not None or not offline_allowed:
+            return matrix
+        
+        return self._matrix_offline(sources, targets)
+    
+    def _fetch_table(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """OSRM /table answer (cached or fetched) for sources x targets"""
+        request = self._build_table_request(sources, targets)
+        data = self.route_cache.get(request['cache_key']) if request else None
+        
+        if request and data is None:
+            for server in self.routing_services:
+                if budget is not None and not budget.acquire_call():
+                    break
+                
+                try:
+                    url = f"{server}/table/v1/driving/{request['coords']}"
+                    
+                    response = self.transport.get(url, params=request['params'], timeout=budget.timeout(15) if budget else 15,
+                                                  retry=budget is None or not budget.limited)
+                    
+                    if response.status_code == 200:
+                        candidate = response.json()
+                        
+                        if candidate.get('code') == 'Ok' and candidate.get('durations'):
+                            data = candidate
+                            self.route_cache.put(request['cache_key'], data)
+                            break
+                            
+                except Exception:
+                    continue
+        
+        return self._parse_table_response(data) if data is not None else None
+    
+    def _matrix_offline(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]]) -> Optional[Dict]:
+        """Many-to-many search on the local road graph (contraction hierarchy, else a Dijkstra per source)"""
+        router = self._get_offline_router()
+        if router is None:
+            return None
+        
+        try:
+            return router.matrix(sources, targets)
+        except Exception:
+            return None
+    
+    def _build_table_request(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]]) -> Optional[Dict]:
+        """OSRM /table request for sources x targets; None when it exceeds the public server's coordinate limit"""
+        # Points shared by both sides (e.g. waypoints) are sent once and referenced by index
+        positions = {}
+        points = []
+        for point in list(sources) + list(targets):
+            if point not in positions:
+                positions[point] = len(points)
+                points.append(point)
+        
+        if len(points) > OSRM_TABLE_MAX_COORDINATES:
+            return None
+        
+        params = {
+            'sources': ";".join(str(positions[point]) for point in sources),
+            'destinations': ";".join(str(positions[point]) for point in targets),
+            'annotations': 'duration,distance'
+        }
+        
+        return {
+            'coords': ";".join(f"{lon},{lat}" for lat, lon in points),
+            'params': params,
+            'cache_key': self.route_cache.make_key(points, {'profile': 'driving', 'service': 'table', **params})
+        }
+    
+    def _parse_table_response(self, data: Dict) -> Dict:
+        """Convert an OSRM table response into minutes / kilometres, None where unreachable"""
+        durations = data['durations']
+        distances = data.get('distances') or [[None] * len(row) for row in durations]
+        
+        return {
+            'durations': [[None if value is None else value / 60 for value in row] for row in durations],
+            'distances': [[None if value is None else value / 1000 for value in row] for row in distances],
+            'success': True,
+            'service': 'OSRM'
+        }
+    
+    def _candidate_limits(self) -> Tuple[int, int]:
+        """(max path combinations, waypoint pool for dual-waypoint pairs)"""
+        if self._local_legs_are_cheap():
+            return self.LOCAL_MAX_COMBINATIONS, self.LOCAL_PAIR_POOL_SIZE
+        return self.MAX_COMBINATIONS, self.PAIR_POOL_SIZE
+    
+    def _local_legs_are_cheap(self) -> bool:
+        """Legs come from the contraction hierarchy, so every candidate can be evaluated"""
+        if not self.local_routing:
+            return False
+        router = self._get_offline_router()
+        return router is not None and router.hierarchy is not None
+    
+    def _build_route_request(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None, alternatives: bool = True) -> Dict:
+        """OSRM coordinate string, query params and cache key for a route request"""
+        
+        points = [(start_lat, start_lon)]
+        if waypoints:
+            points.extend(waypoints)
+        points.append((end_lat, end_lon))
+        
+        params = {
+            'overview': 'full',
+            'geometries': 'geojson',
+            'steps': 'false',
+            'alternatives': 'true' if alternatives else 'false',
+            'continue_straight': 'false'
+        }
+        
+        return {
+            'coords': ";".join(f"{lon},{lat}" for lat, lon in points),
+            'params': params,
+            'cache_key': self.route_cache.make_key(points, {'profile': 'driving', **params})
+        }
+    
+    def _parse_route_response(self, data: Dict, waypoints: List[Tuple[float, float]] = None) -> Dict:
+        """Convert an OSRM route response into the engine's route dict"""
+        
+        if not waypoints and len(data['routes']) > 1:
+            return {
+                'routes': data['routes'],
+                'multiple_routes': True,
+                'service': 'OSRM'
+            }
+        
+        route_info = data['routes'][0]
+        coordinates = route_info['geometry']['coordinates']
+        route_points = [(coord[1], coord[0]) for coord in coordinates]
+        
+        return {
+            'route': route_points,
+            'distance': route_info['distance'] / 1000,
+            'duration': route_info['duration'] / 60,
+            'success': True,
+            'service': 'OSRM'
+        }
+    
     def _create_realistic_route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None) -> Dict:
-        """Create realistic route when services fail"""
+        """Create realistic route when services fail and the points are outside the local road graph"""
         
         route_points = []
         total_distance = 0
@@ -152,7 +932,7 @@ class OptimizedRouteEngine:
             current_lat, current_lon = all_points[i]
             next_lat, next_lon = all_points[i + 1]
             
-            distance = geodesic((current_lat, current_lon), (next_lat, next_lon)).kilometers
+            distance = distance_km((current_lat, current_lon), (next_lat, next_lon))
             total_distance += distance
             
             segment_points = self._generate_realistic_segment(current_lat, current_lon, next_lat, next_lon)
@@ -175,7 +955,7 @@ class OptimizedRouteEngine:
     def _generate_realistic_segment(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> List[Tuple[float, float]]:
         """Generate realistic road-like segment"""
         
-        distance = geodesic((start_lat, start_lon), (end_lat, end_lon)).kilometers
+        distance = distance_km((start_lat, start_lon), (end_lat, end_lon))
         num_points = max(8, int(distance * 2))
         
         lat_diff = end_lat - start_lat
@@ -199,216 +979,596 @@ class OptimizedRouteEngine:
         return points
     
     def calculate_route_conflicts(self, route: List[Tuple[float, float]], blockages: List[Blockage]) -> Dict:
-        """Calculate conflicts with route"""
+        """Calculate conflicts with route (blockages may be a list or a BlockageGridIndex)"""
         if not route or not blockages:
             return {'has_conflicts': False, 'conflict_points': [], 'conflict_percentage': 0.0}
         
-        conflict_points = []
-        total_route_length = 0
-        conflict_length = 0
+        index = BlockageGridIndex.ensure(blockages)
+        points = np.asarray(route, dtype=float).reshape(-1, 2)
+        segment_lengths = _segment_lengths_m(points)
+        
+        hits = _segment_circle_hits(points, index, CONFLICT_BUFFER_M)
+        return _summarize_conflicts(points, segment_lengths, hits, index.blockages)
+    
+    def is_route_clear(self, route: List[Tuple[float, float]], blockages: List[Blockage]) -> bool:
+        """Fast predicate: True if no segment touches a buffered blockage; stops at the first hit"""
+        if not route or not blockages:
+            return True
+        
+        index = BlockageGridIndex.ensure(blockages)
+        points = np.asarray(route, dtype=float).reshape(-1, 2)
+        
+        if len(index.bbox_positions(points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max(), CONFLICT_BUFFER_M)) == 0:
+            return True
         
-        for i in range(len(route) - 1):
-            point_a = route[i]
-            point_b = route[i + 1]
+        for offset in range(0, len(points) - 1, CLEAR_CHECK_CHUNK):
+            chunk = points[offset:offset + CLEAR_CHECK_CHUNK + 1]
+            positions = index.bbox_positions(chunk[:, 0].min(), chunk[:, 1].min(), chunk[:, 0].max(), chunk[:, 1].max(), CONFLICT_BUFFER_M)
+            if len(positions) == 0:
+                continue
             
-            segment_length = geodesic(point_a, point_b).meters
-            total_route_length += segment_length
+            if len(_segment_circle_hits(chunk, index, CONFLICT_BUFFER_M, positions)['segment']):
+                return False
+        
+        return True
+    
+    def find_optimal_avoidance_route(self, start: Location, end: Location, blockages: List[Blockage], deadline_ms: Optional[float] = None,
+                                     max_upstream_calls: Optional[int] = None, accept_detour_ratio: Optional[float] = None) -> Optional[Dict]:
+        """
+        Comprehensive pathfinding that explores ALL possible routes.
+        With ``deadline_ms`` / ``max_upstream_calls`` it becomes an anytime search:
+        candidates run best-first and the best route so far is returned once the
+        budget is spent or a conflict-free route within ``accept_detour_ratio`` of
+        the straight-line distance is found, with the share of candidates covered.
+        """
+        if not blockages:
+            return None
+        
+        st.info("🔍 Comprehensive Route Exploration - Testing ALL possible paths...")
+        
+        blockages = BlockageGridIndex.ensure(blockages)
+        budget = SearchBudget(deadline_ms, max_upstream_calls)
+        
+        alternatives = self._try_osrm_alternatives(start, end, blockages, budget)
+        if alternatives:
+            return alternatives
+        
+        # Local stages cannot be interrupted, so none starts once the deadline has passed
+        if not budget.expired():
+            masked_route = self._route_around_blockages(start, end, blockages)
+            if masked_route:
+                return masked_route
+        
+        if budget.expired():
+            return self._finish_out_of_budget(start, end, budget)
+        
+        if self.search_strategy == "branch_and_bound":
+            return self._find_branch_and_bound_route(start, end, blockages, budget, accept_detour_ratio)
+        
+        all_paths = self._prepare_path_combinations(start, end, blockages, budget)
+        search = AvoidanceSearch(start, end, len(all_paths), budget, accept_detour_ratio,
+                                 snap_tolerance_km=self._endpoint_snap_tolerance_km(start, end), waypoints_snapped=self._get_offline_router() is not None)
+        
+        progress_bar = st.progress(0)
+        
+        # Fetches run on a bounded pool; results are scored on this thread as they arrive.
+        executor = ThreadPoolExecutor(max_workers=max(1, self.max_in_flight))
+        try:
+            candidates = iter(enumerate(all_paths))
+            pending = {}
+            
+            def submit_next():
+                if search.should_stop():
+                    return
+                for i, path_combo in candidates:
+                    if search.prune(i, path_combo):
+                        continue
+                    future = executor.submit(self._evaluate_path_combination, start, end, path_combo, blockages, budget)
+                    pending[future] = (i, path_combo)
+                    return
             
-            segment_conflicts = False
+            for _ in range(max(1, self.max_in_flight)):
+                submit_next()
             
-            for j in range(5):
-                ratio = j / 4
-                check_lat = point_a[0] + (point_b[0] - point_a[0]) * ratio
-                check_lon = point_a[1] + (point_b[1] - point_a[1]) * ratio
+            while pending:
+                done, _ = wait(pending, timeout=budget.remaining_s(), return_when=FIRST_COMPLETED)
+                if not done:
+                    search.should_stop()
+                    break
                 
-                for blockage in blockages:
-                    distance_to_blockage = geodesic((check_lat, check_lon), (blockage.lat, blockage.lon)).meters
+                for future in sorted(done, key=lambda f: pending[f][0]):
+                    i, path_combo = pending.pop(future)
                     
-                    if distance_to_blockage <= (blockage.radius + 150):
-                        conflict_points.append({
-                            'index': i,
-                            'point': (check_lat, check_lon),
-                            'blockage': blockage,
-                            'distance_to_center': distance_to_blockage
-                        })
-                        segment_conflicts = True
-                        break
-                
-                if segment_conflicts:
-                    break
-            
-            if segment_conflicts:
-                conflict_length += segment_length
+                    try:
+                        evaluation = future.result()
+                        if search.needs_report(i, evaluation):
+                            evaluation['conflicts'] = self.calculate_route_conflicts(evaluation['route_data']['route'], blockages)
+                        search.record(i, path_combo, evaluation)
+                    except Exception as e:
+                        search.record_failure(path_combo, e)
+                    
+                    # Only now do prune / should_stop see this result
+                    submit_next()
+                    
+                    progress_bar.progress(search.candidates_done / len(all_paths))
+        finally:
+            # Past the deadline nobody waits for stragglers; their results are discarded
+            executor.shutdown(wait=False, cancel_futures=True)
         
-        conflict_percentage = (conflict_length / total_route_length * 100) if total_route_length > 0 else 0
+        progress_bar.empty()
+        
+        return search.finish()
+    
+    def _endpoint_snap_tolerance_km(self, start: Location, end: Location) -> float:
+        """
+        How much snapping start and end onto the road can shorten a route: the
+        distance to the nearest road node (an edge is never farther). Measured
+        on the road graph, assumed when there is none.
+        """
+        router = self._get_offline_router()
+        if router is None:
+            return 2 * SNAP_TOLERANCE_M / 1000
+        
+        try:
+            _, offsets = router.graph.nearest_nodes([start.lat, end.lat], [start.lon, end.lon])
+            return float(offsets.sum()) / 1000
+        except Exception:
+            return 2 * SNAP_TOLERANCE_M / 1000
+    
+    def _finish_out_of_budget(self, start: Location, end: Location, budget: SearchBudget) -> Optional[Dict]:
+        """Report a search whose deadline passed before any candidate was evaluated"""
+        search = AvoidanceSearch(start, end, 0, budget)
+        search.should_stop()
+        return search.finish()
+    
+    def _route_around_blockages(self, start: Location, end: Location, blockages: List[Blockage]) -> Optional[Dict]:
+        """Optimal conflict-free route on the local road graph with blocked edges masked out"""
+        router = self._get_offline_router()
+        if router is None:
+            return None
+        
+        index = BlockageGridIndex.ensure(blockages)
+        
+        try:
+            closed_edges = router.graph.closed_edge_mask(index.lats, index.lons, index.radii + CONFLICT_BUFFER_M)
+            route_data = router.route(start.lat, start.lon, end.lat, end.lon, closed_edges=closed_edges)
+        except Exception:
+            return None
+        
+        if not route_data:
+            return None
+        
+        # Snapping can still place the first or last point inside a buffer
+        conflicts = self.calculate_route_conflicts(route_data['route'], index)
+        if conflicts.get('has_conflicts'):
+            return None
+        
+        direct_distance = distance_km((start.lat, start.lon), (end.lat, end.lon))
+        path = RoutePath([], route_data['distance'], conflicts, route_data['route'])
+        score = path.calculate_score(direct_distance)
+        
+        st.success(f"✅ Conflict-free road graph route with blocked roads masked - Score: {score:.1f}")
         
         return {
-            'has_conflicts': len(conflict_points) > 0,
-            'conflict_points': conflict_points,
-            'conflict_percentage': min(conflict_percentage, 100.0),
-            'total_points': len(route),
-            'conflict_length': conflict_length,
-            'total_length': total_route_length
+            **route_data,
+            'conflicts': conflicts,
+            'strategy_name': 'Masked Road Graph Search',
+            'efficiency_score': path.efficiency_score,
+            'distance_impact': ((route_data['distance'] - direct_distance) / direct_distance) * 100 if direct_distance > 0 else 0,
+            'waypoints': [],
+            'exploration_method': 'Blockage-Masked Bidirectional Dijkstra',
+            'total_paths_tested': 1,
+            'valid_paths_found': 1
         }
     
-    def find_optimal_avoidance_route(self, start: Location, end: Location, blockages: List[Blockage]) -> Optional[Dict]:
-        """Comprehensive pathfinding that explores ALL possible routes"""
-        if not blockages:
-            return None
+    def _find_branch_and_bound_route(self, start: Location, end: Location, blockages: List[Blockage], budget: Optional[SearchBudget] = None,
+                                     accept_detour_ratio: Optional[float] = None) -> Optional[Dict]:
+        """Drive the branch-and-bound search with blocking leg fetches"""
+        st.info("🌐 Building comprehensive waypoint network...")
+        path_network = self._build_comprehensive_network(start, end, blockages)
         
-        st.info("🔍 Comprehensive Route Exploration - Testing ALL possible paths...")
+        if budget is not None and budget.expired():
+            return self._finish_out_of_budget(start, end, budget)
         
-        alternatives = self._try_osrm_alternatives(start, end, blockages)
-        if alternatives:
-            return alternatives
+        st.info(f"🌳 Branch and bound over {len(path_network)} waypoints (chains of up to {self.MAX_CHAIN_WAYPOINTS})")
+        
+        max_legs, _ = self._candidate_limits()
+        search = AvoidanceSearch(start, end, 0, budget, accept_detour_ratio)
+        steps = self._branch_and_bound_steps(start, end, path_network, blockages, search, max_legs)
+        
+        progress_bar = st.progress(0)
+        calls = 0
+        try:
+            request = next(steps)
+            while True:
+                calls += 1
+                progress_bar.progress(min(1.0, calls / max_legs))
+                request = steps.send(self.get_leg(*request, budget))
+        except StopIteration:
+            pass
+        progress_bar.empty()
+        
+        return search.finish()
+    
+    def _branch_and_bound_steps(self, start: Location, end: Location, network_nodes: List[PathNode], blockages: List[Blockage], search: AvoidanceSearch, max_legs: int):
+        """Best-first branch and bound over waypoint chains; yields (leg_start, leg_end) and takes the fetched leg back"""
+        # Bound: fetched road length plus the straight line for the rest. The
+        # incumbent is the shortest conflict-free chain so far, and a conflicting
+        # leg prunes its whole subtree. Coverage counts resolved chains.
+        index = BlockageGridIndex.ensure(blockages)
+        fingerprint = _blockage_fingerprint(index.blockages)
+        end_point = (end.lat, end.lon)
+        points = [(start.lat, start.lon)] + [(node.lat, node.lon) for node in network_nodes]
+        names = ["Start"] + [node.name for node in network_nodes]
+        
+        lats = np.array([p[0] for p in points])
+        lons = np.array([p[1] for p in points])
+        to_end_km = distance_m_batch(lats, lons, end.lat, end.lon) / 1000
+        
+        # Open chains: (bound, order, chain, fetched legs, fetched_km); the last leg is not fetched yet
+        order = itertools.count()
+        heap = []
+        incumbent = math.inf
+        legs_fetched = 0
+        pruned = 0
+        generated = 1  # the direct chain
+        
+        def expand(chain: Tuple[int, ...], legs: List[Dict], fetched_km: float):
+            nonlocal pruned, generated
+            if len(chain) >= self.MAX_CHAIN_WAYPOINTS:
+                return
+            # Measure from where the fetched legs actually end (the snapped waypoint)
+            tail_lat, tail_lon = legs[-1]['route'][-1] if legs else points[0]
+            hop_km = distance_m_batch(tail_lat, tail_lon, lats, lons) / 1000
+            for j in range(1, len(points)):
+                if j in chain:
+                    continue
+                child_bound = fetched_km + float(hop_km[j] + to_end_km[j])
+                generated += 1
+                if child_bound >= incumbent:
+                    pruned += 1
+                    continue
+                heapq.heappush(heap, (child_bound, next(order), chain + (j,), legs, fetched_km))
+        
+        def close(chain: Tuple[int, ...], legs: List[Dict], bound: float):
+            """Score the finished chain; conflict-free ones become the incumbent when shorter"""
+            nonlocal incumbent
+            route_data = self._stitch_legs(legs)
+            chain_points = [points[0]] + [points[i] for i in chain] + [end_point]
+            conflicts = self.chain_conflicts(chain_points, index) or self.calculate_route_conflicts(route_data['route'], index)
+            path_combo = {
+                'name': "B&B: " + " → ".join(names[i] for i in chain) if chain else "B&B: Direct",
+                'waypoints': chain_points[1:-1],
+                'estimated_distance': bound,
+                'waypoint_count': len(chain)
+            }
+            evaluation = {'route_data': route_data, 'conflicts': conflicts}
+            
+            if conflicts.get('has_conflicts'):
+                # Recorded as a fallback in case no conflict-free chain turns up
+                search.record(next(order), path_combo, evaluation)
+            elif route_data['distance'] < incumbent:
+                incumbent = route_data['distance']
+                search.record(next(order), path_combo, evaluation)
+        
+        direct = yield points[0], end_point
+        legs_fetched += 1
+        if direct:
+            close((), [direct], float(to_end_km[0]))
+        expand((), [], 0.0)
+        
+        while heap and legs_fetched < max_legs:
+            if search.should_stop():
+                break
+            
+            bound, _, chain, legs, fetched_km = heapq.heappop(heap)
+            if bound >= incumbent:
+                # Every remaining bound is at least as large: the incumbent is optimal
+                pruned += len(heap) + 1
+                heap = []
+                break
+            
+            last = chain[-1]
+            previous = chain[-2] if len(chain) > 1 else 0
+            leg_start, leg_end = points[previous], points[last]
+            leg = yield leg_start, leg_end
+            legs_fetched += 1
+            
+            if not leg or not self._leg_is_clear(leg_start, leg_end, leg, index, fingerprint):
+                pruned += 1
+                continue
+            
+            legs = legs + [leg]
+            fetched_km += leg['distance']
+            tail_lat, tail_lon = leg['route'][-1]
+            prefix_bound = fetched_km + float(distance_m_batch(tail_lat, tail_lon, end.lat, end.lon)) / 1000
+            if prefix_bound >= incumbent:
+                pruned += 1
+                continue
+            
+            if legs_fetched < max_legs:
+                final_leg = yield leg_end, end_point
+                legs_fetched += 1
+                if final_leg:
+                    close(chain, legs + [final_leg], prefix_bound)
+            
+            expand(chain, legs, fetched_km)
+        
+        if heap and search.stop_reason is None:
+            search.stop_reason = "leg budget reached"
+        search.report_coverage(generated - len(heap), generated)
+        
+        status = search.stop_reason or "search space exhausted"
+        st.info(f"✂️ Branch and bound: {legs_fetched} legs fetched, {pruned} subtrees pruned ({status})")
+    
+    def _leg_is_clear(self, leg_start: Tuple[float, float], leg_end: Tuple[float, float], leg: Dict, index: BlockageGridIndex, fingerprint: str) -> bool:
+        cached = self.leg_cache.leg_hits(leg_start, leg_end, index, fingerprint)
+        if cached is None:
+            return self.is_route_clear(leg['route'], index)
+        return len(cached[2]['segment']) == 0
+    
+    def _prepare_path_combinations(self, start: Location, end: Location, blockages: List[Blockage], budget: Optional[SearchBudget] = None) -> List[Dict]:
+        """Build the waypoint network and the ordered candidate list for an avoidance search"""
         
         st.info("🌐 Building comprehensive waypoint network...")
         path_network = self._build_comprehensive_network(start, end, blockages)
         
         st.info(f"📊 Generated {len(path_network)} waypoint candidates")
         
+        if budget is not None and budget.expired():
+            return []
+        
         st.info("🔄 Exploring all possible path combinations...")
-        all_paths = self._explore_all_path_combinations(start, end, path_network, blockages)
+        all_paths = self._explore_all_path_combinations(start, end, path_network, blockages, self.PRESCREEN_POOL)
+        
+        sources, targets = self._prescreen_points(start, end, all_paths)
+        matrix = self._prescreen_matrix(sources, targets, budget) if all_paths and not (budget and budget.expired()) else None
+        all_paths = self._rank_by_road_distance(all_paths, matrix)
         
         st.info(f"🎯 Testing {len(all_paths)} unique path combinations")
         
-        best_path = None
-        best_score = -1
-        paths_tested = 0
-        valid_paths = 0
+        return all_paths
+    
+    def _prescreen_matrix(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Road-length matrix for the pre-screen, skipping the offline one when it would cost more than it saves"""
+        if self._offline_matrix_is_cheap(len(sources)):
+            return self.distance_matrix(sources, targets, budget)
+        return self._fetch_table(sources, targets, budget)
+    
+    def _offline_matrix_is_cheap(self, source_count: int) -> bool:
+        """Whether the local matrix is quick: a hierarchy query, or only a few single-source Dijkstra runs"""
+        router = self._get_offline_router()
+        return router is None or router.hierarchy is not None or source_count <= self.PRESCREEN_DIJKSTRA_SOURCES
+    
+    def _prescreen_points(self, start: Location, end: Location, all_paths: List[Dict]) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        """Matrix sources/targets covering every leg of every chain: [start] + waypoints and waypoints + [end]"""
+        waypoints = list(dict.fromkeys(tuple(wp) for path_combo in all_paths for wp in path_combo['waypoints']))
+        return [(start.lat, start.lon)] + waypoints, waypoints + [(end.lat, end.lon)]
+    
+    def _rank_by_road_distance(self, all_paths: List[Dict], matrix: Optional[Dict]) -> List[Dict]:
+        """Order chains by road length summed from one matrix call, or keep the straight-line order without one"""
+        if not matrix:
+            st.info("📐 No road-length matrix available; ranking chains by straight-line distance")
+            return self._limit_path_combinations(all_paths)
         
-        progress_bar = st.progress(0)
+        distances = matrix['distances']
+        waypoints = list(dict.fromkeys(tuple(wp) for path_combo in all_paths for wp in path_combo['waypoints']))
+        rows = {wp: i + 1 for i, wp in enumerate(waypoints)}
+        columns = {wp: i for i, wp in enumerate(waypoints)}
+        end_column = len(waypoints)
         
-        for i, path_combo in enumerate(all_paths):
-            try:
-                progress = (i + 1) / len(all_paths)
-                progress_bar.progress(progress)
-                
-                paths_tested += 1
-
-                route_data = self.get_reliable_route(
-                    start.lat, start.lon,
-                    end.lat, end.lon,
-                    path_combo['waypoints']
-                )
-                
-                if route_data and route_data.get('success'):
-
-                    conflicts = self.calculate_route_conflicts(route_data['route'], blockages)
-                    
-
-                    path = RoutePath(
-                        nodes=[], 
-                        total_distance=route_data['distance'],
-                        conflicts=conflicts,
-                        route_points=route_data['route']
-                    )
-
-                    direct_distance = geodesic((start.lat, start.lon), (end.lat, end.lon)).kilometers
-                    score = path.calculate_score(direct_distance)
-                    
-                    if not conflicts.get('has_conflicts'):
-                        valid_paths += 1
-                        st.success(f"✅ Valid path {valid_paths}: {path_combo['name']} - Score: {score:.1f}")
-                    else:
-                        st.info(f"⚠️ Path {paths_tested}: {path_combo['name']} - Conflicts: {conflicts['conflict_percentage']:.1f}%")
-                    
-                    if score > best_score:
-                        best_score = score
-                        best_path = {
-                            **route_data,
-                            'conflicts': conflicts,
-                            'strategy_name': path_combo['name'],
-                            'efficiency_score': path.efficiency_score,
-                            'distance_impact': ((route_data['distance'] - direct_distance) / direct_distance) * 100 if direct_distance > 0 else 0,
-                            'waypoints': path_combo['waypoints'],
-                            'total_paths_tested': paths_tested,
-                            'valid_paths_found': valid_paths,
-                            'exploration_completeness': 100.0
-                        }
-                        
-                        st.info(f"🏆 New best path: {path_combo['name']} (Score: {score:.1f})")
-
-                        
-            except Exception as e:
-                st.warning(f"Path failed: {path_combo.get('name', 'Unknown')} - {str(e)}")
+        ranked = []
+        for path_combo in all_paths:
+            chain = [tuple(wp) for wp in path_combo['waypoints']]
+            legs = zip([0] + [rows[wp] for wp in chain], [columns[wp] for wp in chain] + [end_column])
+            leg_distances = [distances[row][column] for row, column in legs]
+            
+            if None in leg_distances:
                 continue
+            
+            ranked.append({**path_combo, 'road_distance': sum(leg_distances)})
         
-        progress_bar.empty()
+        ranked.sort(key=lambda x: x['road_distance'])
         
-        if best_path:
-            st.balloons()
-            st.success(f"🎯 COMPREHENSIVE EXPLORATION COMPLETE!")
-            st.success(f"📊 Tested {paths_tested} paths, found {valid_paths} conflict-free options")
-            st.success(f"🏆 OPTIMAL PATH: {best_path['strategy_name']}")
-            st.success(f"⭐ Final Score: {best_score:.1f}, Efficiency: {best_path['efficiency_score']:.1f}%")
+        st.info(f"📐 Road-length pre-screen ({matrix['service']} matrix): ranked {len(ranked)} chains")
+        
+        return self._limit_path_combinations(ranked)
+    
+    def _limit_path_combinations(self, path_combinations: List[Dict]) -> List[Dict]:
+        """Keep the most promising candidates; online, only as many chains as fit in MAX_COMBINATIONS distinct legs"""
+        max_combinations, _ = self._candidate_limits()
+        if self._local_legs_are_cheap():
+            kept = path_combinations[:max_combinations]
         else:
-            st.error("❌ No valid paths found after comprehensive exploration")
+            legs = set()
+            kept = []
+            for path_combo in path_combinations:
+                chain = [tuple(wp) for wp in path_combo['waypoints']]
+                chain_legs = set(zip(['start'] + chain, chain + ['end']))
+                if len(legs | chain_legs) > max_combinations:
+                    break
+                legs |= chain_legs
+                kept.append(path_combo)
         
-        return best_path
+        if len(kept) < len(path_combinations):
+            st.warning(f"⚠️ Limiting to {len(kept)} most promising path combinations (out of {len(path_combinations)} total)")
+        
+        return kept
+    
+    def _evaluate_path_combination(self, start: Location, end: Location, path_combo: Dict, blockages: List[Blockage], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
+        """Stitch one candidate from cached legs and take its conflicts from the legs; safe to run on a worker thread"""
+        route_data = self.get_chain_route(
+            start.lat, start.lon,
+            end.lat, end.lon,
+            path_combo['waypoints'],
+            budget
+        )
+        
+        if not route_data or not route_data.get('success'):
+            return None
+        
+        chain_points = self._chain_points(start.lat, start.lon, end.lat, end.lon, path_combo['waypoints'])
+        conflicts = self.chain_conflicts(chain_points, blockages)
+        if conflicts is None:
+            conflicts = self._screen_route_conflicts(route_data['route'], blockages)
+        
+        return {'route_data': route_data, 'conflicts': conflicts}
     
-    def _try_osrm_alternatives(self, start: Location, end: Location, blockages: List[Blockage]) -> Optional[Dict]:
+    def _screen_route_conflicts(self, route: List[Tuple[float, float]], blockages: List[Blockage]) -> Optional[Dict]:
+        """Clear routes get their (trivial) report now; conflicting ones return None until a full report is needed"""
+        if self.is_route_clear(route, blockages):
+            return _clear_conflict_report(np.asarray(route, dtype=float).reshape(-1, 2))
+        return None
+    
+    def _try_osrm_alternatives(self, start: Location, end: Location, blockages: List[Blockage], budget: Optional[SearchBudget] = None) -> Optional[Dict]:
         """Try OSRM natural alternatives first"""
         
-        route_data = self.get_reliable_route(start.lat, start.lon, end.lat, end.lon)
+        route_data = self.get_reliable_route(start.lat, start.lon, end.lat, end.lon, budget=budget)
         
         if route_data and route_data.get('multiple_routes'):
-            st.info("🛣️ Testing OSRM natural alternatives...")
-            
-            best_alternative = None
-            best_score = -1
-            
-            for i, route_info in enumerate(route_data['routes']):
-                try:
-                    coordinates = route_info['geometry']['coordinates']
-                    route_points = [(coord[1], coord[0]) for coord in coordinates]
-                    
-                    conflicts = self.calculate_route_conflicts(route_points, blockages)
-                    
-                    distance_km = route_info['distance'] / 1000
-                    duration_min = route_info['duration'] / 60
-                    
-                    direct_distance = geodesic((start.lat, start.lon), (end.lat, end.lon)).kilometers
-                    
-                    path = RoutePath([], distance_km, conflicts, route_points)
-                    score = path.calculate_score(direct_distance)
-                    
-                    st.info(f"🛣️ OSRM Alt {i+1}: {distance_km:.1f}km, "
-                           f"Conflicts: {conflicts['conflict_percentage']:.1f}%, Score: {score:.1f}")
-                    
-                    if score > best_score:
-                        best_score = score
-                        best_alternative = {
-                            'route': route_points,
-                            'distance': distance_km,
-                            'duration': duration_min,
-                            'success': True,
-                            'service': 'OSRM',
-                            'conflicts': conflicts,
-                            'strategy_name': f'OSRM Natural Alternative {i+1}',
-                            'efficiency_score': path.efficiency_score,
-                            'distance_impact': ((distance_km - direct_distance) / direct_distance) * 100 if direct_distance > 0 else 0,
-                            'exploration_method': 'OSRM Natural Alternatives'
-                        }
-                    
-                        
-                except Exception:
+            conflicts_list = self._alternative_conflicts(start, end, route_data['routes'], blockages)
+            return self._select_osrm_alternative(start, end, route_data['routes'], conflicts_list)
+        
+        return None
+    
+    def _alternative_conflicts(self, start: Location, end: Location, routes: List[Dict], blockages: List[Blockage]) -> List[Optional[Dict]]:
+        """Screen alternatives first; full reports only for conflicting ones that could still be picked"""
+        blockages = BlockageGridIndex.ensure(blockages)
+        direct_distance = distance_km((start.lat, start.lon), (end.lat, end.lon))
+        
+        conflicts_list = [None] * len(routes)
+        deferred = []
+        best_clear_score = -1
+        
+        for i, route_info in enumerate(routes):
+            try:
+                route_points = self._route_info_points(route_info)
+                conflicts = self._screen_route_conflicts(route_points, blockages)
+                
+                if conflicts is None:
+                    deferred.append((i, route_points))
                     continue
-            
-            if best_alternative and best_score > 50:  
-                st.success(f"✅ Good natural alternative found: {best_alternative['strategy_name']}")
-                return best_alternative
+                
+                conflicts_list[i] = conflicts
+                path = RoutePath([], route_info['distance'] / 1000, conflicts, route_points)
+                best_clear_score = max(best_clear_score, path.calculate_score(direct_distance))
+            except Exception:
+                continue
+        
+        for i, route_points in deferred:
+            try:
+                if _optimistic_conflict_score(routes[i]['distance'] / 1000, direct_distance) > best_clear_score:
+                    conflicts_list[i] = self.calculate_route_conflicts(route_points, blockages)
+            except Exception:
+                continue
+        
+        return conflicts_list
+    
+    def _route_info_points(self, route_info: Dict) -> List[Tuple[float, float]]:
+        """(lat, lon) points of a raw OSRM route object"""
+        return [(coord[1], coord[0]) for coord in route_info['geometry']['coordinates']]
+    
+    def _select_osrm_alternative(self, start: Location, end: Location, routes: List[Dict], conflicts_list: List[Optional[Dict]]) -> Optional[Dict]:
+        """Score OSRM natural alternatives whose conflicts are already known"""
+        
+        st.info("🛣️ Testing OSRM natural alternatives...")
+        
+        best_alternative = None
+        best_score = -1
+        direct_distance = distance_km((start.lat, start.lon), (end.lat, end.lon))
+        
+        for i, (route_info, conflicts) in enumerate(zip(routes, conflicts_list)):
+            try:
+                if conflicts is None:
+                    continue
+                
+                route_points = self._route_info_points(route_info)
+                
+                distance_km = route_info['distance'] / 1000
+                duration_min = route_info['duration'] / 60
+                
+                path = RoutePath([], distance_km, conflicts, route_points)
+                score = path.calculate_score(direct_distance)
+                
+                st.info(f"🛣️ OSRM Alt {i+1}: {distance_km:.1f}km, "
+                       f"Conflicts: {conflicts['conflict_percentage']:.1f}%, Score: {score:.1f}")
+                
+                if score > best_score:
+                    best_score = score
+                    best_alternative = {
+                        'route': route_points,
+                        'distance': distance_km,
+                        'duration': duration_min,
+                        'success': True,
+                        'service': 'OSRM',
+                        'conflicts': conflicts,
+                        'strategy_name': f'OSRM Natural Alternative {i+1}',
+                        'efficiency_score': path.efficiency_score,
+                        'distance_impact': ((distance_km - direct_distance) / direct_distance) * 100 if direct_distance > 0 else 0,
+                        'exploration_method': 'OSRM Natural Alternatives'
+                    }
+                
+                    
+            except Exception:
+                continue
+        
+        if best_alternative and best_score > 50:  
+            st.success(f"✅ Good natural alternative found: {best_alternative['strategy_name']}")
+            return best_alternative
         
         return None
     
     def _build_comprehensive_network(self, start: Location, end: Location, blockages: List[Blockage]) -> List[PathNode]:
+        """Waypoint candidates for this trip: the shared network of the blockage set, minus hopeless detours"""
+        
+        index = BlockageGridIndex.ensure(blockages)
+        network_nodes = self._get_waypoint_network(index)
+        
+        direct_distance = distance_km((start.lat, start.lon), (end.lat, end.lon))
+        max_detour = direct_distance * self.MAX_WAYPOINT_DETOUR
+        
+        # Any chain through a node is at least as long as the single-waypoint detour through it
+        return [
+            node for node in network_nodes
+            if distance_km((start.lat, start.lon), (node.lat, node.lon)) + distance_km((node.lat, node.lon), (end.lat, end.lon)) <= max_detour
+        ]
+    
+    def _get_waypoint_network(self, blockages: BlockageGridIndex) -> List[PathNode]:
+        """
+        Snapped waypoint network of a blockage set. It depends only on the
+        blockages and on how this engine snaps (which road graph, which snap
+        limit), so it is built once per such key and shared by every engine in
+        the process until the blockage set changes.
+        """
+        router = self._get_offline_router()
+        snapping = None
+        if router is not None:
+            graph = router.graph
+            snapping = (id(graph), graph.node_count, graph.edge_count, router.max_snap_distance_m)
+        key = (_blockage_fingerprint(blockages), snapping)
+        
+        with _NETWORK_LOCK:
+            network_nodes = _NETWORK_CACHE.get(key)
+            if network_nodes is not None:
+                _NETWORK_CACHE.move_to_end(key)
+                return network_nodes
+        
+        network_nodes = self._generate_waypoint_network(blockages, router)
+        
+        with _NETWORK_LOCK:
+            _NETWORK_CACHE[key] = network_nodes
+            _NETWORK_CACHE.move_to_end(key)
+            while len(_NETWORK_CACHE) > _NETWORK_CACHE_SIZE:
+                _NETWORK_CACHE.popitem(last=False)
+        
+        return network_nodes
+    
+    def _generate_waypoint_network(self, blockages: List[Blockage], router: Optional[OfflineRouter] = None) -> List[PathNode]:
         """Build comprehensive network of waypoint candidates"""
         
+        index = BlockageGridIndex.ensure(blockages)
         network_nodes = []
         
-        start_node = PathNode(start.lat, start.lon, "start", "Start")
-        end_node = PathNode(end.lat, end.lon, "end", "End")
-        
         for i, blockage in enumerate(blockages):
             rings = [1.5, 2.0, 2.5, 3.0]  
             angles = [0, 45, 90, 135, 180, 225, 270, 315] 
@@ -427,11 +1587,9 @@ class OptimizedRouteEngine:
                     waypoint_lon = blockage.lon + lon_offset
                     
                     is_safe = True
-                    min_distance_to_any_blockage = float('inf')
                     
-                    for check_blockage in blockages:
-                        distance_to_blockage = geodesic((waypoint_lat, waypoint_lon), (check_blockage.lat, check_blockage.lon)).meters
-                        min_distance_to_any_blockage = min(min_distance_to_any_blockage, distance_to_blockage)
+                    for check_blockage in index.query(waypoint_lat, waypoint_lon, 300):
+                        distance_to_blockage = distance_m(waypoint_lat, waypoint_lon, check_blockage.lat, check_blockage.lon)
                         
                         if distance_to_blockage <= (check_blockage.radius + 300):  # 300m safety buffer
                             is_safe = False
@@ -448,7 +1606,7 @@ class OptimizedRouteEngine:
             
             max_extent = 0
             for blockage in blockages:
-                distance_to_center = geodesic((center_lat, center_lon), (blockage.lat, blockage.lon)).meters
+                distance_to_center = distance_m(center_lat, center_lon, blockage.lat, blockage.lon)
                 extent = distance_to_center + blockage.radius
                 max_extent = max(max_extent, extent)
             
@@ -467,8 +1625,8 @@ class OptimizedRouteEngine:
                     waypoint_lon = center_lon + lon_offset
                     
                     is_safe = True
-                    for blockage in blockages:
-                        distance_to_blockage = geodesic((waypoint_lat, waypoint_lon), (blockage.lat, blockage.lon)).meters
+                    for blockage in index.query(waypoint_lat, waypoint_lon, 500):
+                        distance_to_blockage = distance_m(waypoint_lat, waypoint_lon, blockage.lat, blockage.lon)
                         if distance_to_blockage <= (blockage.radius + 500):  # 500m buffer for cluster
                             is_safe = False
                             break
@@ -478,54 +1636,147 @@ class OptimizedRouteEngine:
                         waypoint_node = PathNode(waypoint_lat, waypoint_lon, "waypoint", node_name)
                         network_nodes.append(waypoint_node)
         
-        return network_nodes
+        return self._snap_network(network_nodes, index, router)
     
-    def _explore_all_path_combinations(self, start: Location, end: Location, network_nodes: List[PathNode], blockages: List[Blockage]) -> List[Dict]:
-        """Generate ALL possible path combinations to test"""
+    def _snap_network(self, network_nodes: List[PathNode], blockages: List[Blockage], router: Optional[OfflineRouter] = None) -> List[PathNode]:
+        """
+        Move waypoints onto their nearest road node before any route is requested.
+        Waypoints that land off the network or inside a buffered blockage are
+        dropped, and waypoints sharing a road node are kept once.
+        """
+        if router is None or not network_nodes:
+            return network_nodes
+        
+        index = BlockageGridIndex.ensure(blockages)
+        graph = router.graph
         
-        path_combinations = []
-        direct_distance = geodesic((start.lat, start.lon), (end.lat, end.lon)).kilometers
+        road_nodes, snap_distances = graph.nearest_nodes([n.lat for n in network_nodes], [n.lon for n in network_nodes])
         
-        for node in network_nodes:
-            waypoint_lat, waypoint_lon = node.lat, node.lon
+        snapped = []
+        seen = set()
+        off_network = blocked = duplicates = 0
+        
+        for node, road_node, snap_distance in zip(network_nodes, road_nodes.tolist(), snap_distances.tolist()):
+            if snap_distance > router.max_snap_distance_m:
+                off_network += 1
+                continue
             
-            dist_start_to_wp = geodesic((start.lat, start.lon), (waypoint_lat, waypoint_lon)).kilometers
-            dist_wp_to_end = geodesic((waypoint_lat, waypoint_lon), (end.lat, end.lon)).kilometers
-            total_distance = dist_start_to_wp + dist_wp_to_end
+            if road_node in seen:
+                duplicates += 1
+                continue
             
-            if total_distance <= direct_distance * 3:
-                path_combinations.append({
-                    'name': f"Single WP: {node.name}",
-                    'waypoints': [(waypoint_lat, waypoint_lon)],
-                    'estimated_distance': total_distance,
-                    'waypoint_count': 1
-                })
-
+            lat, lon = float(graph.lats[road_node]), float(graph.lons[road_node])
+            if any(distance_m(lat, lon, b.lat, b.lon) <= b.radius + CONFLICT_BUFFER_M for b in index.query(lat, lon, CONFLICT_BUFFER_M)):
+                blocked += 1
+                continue
+            
+            seen.add(road_node)
+            snapped.append(PathNode(lat, lon, node.node_type, node.name))
+        
+        st.info(f"📍 Snapped {len(snapped)} waypoints to the road network "
+                f"({blocked} inside blockages, {duplicates} duplicates, {off_network} off-road dropped)")
+        
+        return snapped
+    
+    def _combination_distances(self, start: Location, end: Location, network_nodes: List[PathNode]) -> Dict[str, np.ndarray]:
+        """
+        Straight-line distances (km) from [start, end] to every network node in
+        one vectorized call. Node-to-node rows are computed by ``_node_row`` only
+        for the pair rows that get opened.
+        """
+        lats = np.array([node.lat for node in network_nodes])
+        lons = np.array([node.lon for node in network_nodes])
+        ends = distance_m_batch(np.array([[start.lat], [end.lat]]), np.array([[start.lon], [end.lon]]), lats, lons) / 1000
+        
+        return {
+            'direct': distance_km((start.lat, start.lon), (end.lat, end.lon)),
+            'from_start': ends[0],
+            'to_end': ends[1],
+            'lats': lats,
+            'lons': lons
+        }
+    
+    def _node_row(self, distances: Dict[str, np.ndarray], node: int, others: np.ndarray) -> np.ndarray:
+        lats, lons = distances['lats'], distances['lons']
+        return distance_m_batch(lats[node], lons[node], lats[others], lons[others]) / 1000
+    
+    def _explore_all_path_combinations(self, start: Location, end: Location, network_nodes: List[PathNode], blockages: List[Blockage], max_combinations: Optional[int] = None) -> List[Dict]:
+        """The most promising path combinations to test, taken from the lazy enumeration"""
+        
+        default_limit, _ = self._candidate_limits()
+        max_combinations = max_combinations or default_limit
+        
+        candidates = self._iter_path_combinations(start, end, network_nodes, blockages)
+        path_combinations = list(itertools.islice(candidates, max_combinations))
+        
+        if next(candidates, None) is not None:
+            st.warning(f"⚠️ Limiting to {max_combinations} most promising path combinations")
+        
+        return path_combinations
+    
+    def _iter_path_combinations(self, start: Location, end: Location, network_nodes: List[PathNode], blockages: List[Blockage]) -> Iterator[Dict]:
+        """Yield single and dual waypoint candidates in increasing estimated distance, building pair rows lazily"""
+        if not network_nodes:
+            return
+        
+        _, pair_pool_size = self._candidate_limits()
+        distances = self._combination_distances(start, end, network_nodes)
+        direct_distance = distances['direct']
+        from_start, to_end = distances['from_start'], distances['to_end']
+        single_totals = from_start + to_end
+        
+        # Entries: (estimate, kind, first, second, rank). Kind -1 is an unopened row,
+        # 0 a single, 1 a pair; ties resolve singles first, then pairs in pool order.
+        heap = [(total, 0, i, -1, 0) for i, total in enumerate(single_totals.tolist()) if total <= direct_distance * 3]
+        
+        top_nodes = np.zeros(0, dtype=np.int64)
         if len(blockages) > 1 or any(b.radius > 1500 for b in blockages):
-
-            sorted_nodes = sorted(network_nodes, key=lambda n: n.distance_to(PathNode(start.lat, start.lon)))
-            top_nodes = sorted_nodes[:min(20, len(sorted_nodes))]  # Top 20 closest nodes
+            top_nodes = np.argsort(from_start, kind='stable')[:pair_pool_size]  # Closest nodes only
+            heap.extend((float(single_totals[node]), -1, position, -1, 0) for position, node in enumerate(top_nodes[:-1].tolist()))
+        
+        heapq.heapify(heap)
+        rows = {}
+        
+        while heap:
+            total, kind, first, second, rank = heapq.heappop(heap)
             
-            for node1, node2 in itertools.combinations(top_nodes, 2):
-
-                dist_start_to_wp1 = geodesic((start.lat, start.lon), (node1.lat, node1.lon)).kilometers
-                dist_wp1_to_wp2 = geodesic((node1.lat, node1.lon), (node2.lat, node2.lon)).kilometers  
-                dist_wp2_to_end = geodesic((node2.lat, node2.lon), (end.lat, end.lon)).kilometers
-                total_distance = dist_start_to_wp1 + dist_wp1_to_wp2 + dist_wp2_to_end
-                
-                if total_distance <= direct_distance * 3.5:
-                    path_combinations.append({
-                        'name': f"Dual WP: {node1.name} → {node2.name}",
-                        'waypoints': [(node1.lat, node1.lon), (node2.lat, node2.lon)],
-                        'estimated_distance': total_distance,
-                        'waypoint_count': 2
-                    })
-        
-        path_combinations.sort(key=lambda x: x['estimated_distance'])
-        
-        max_combinations = 50
-        if len(path_combinations) > max_combinations:
-            st.warning(f"⚠️ Limiting to {max_combinations} most promising path combinations (out of {len(path_combinations)} total)")
-            path_combinations = path_combinations[:max_combinations]
-        
-        return path_combinations
\ No newline at end of file
+            if kind == 0:
+                yield self._path_combination(network_nodes, first, -1, total)
+                continue
+            
+            if kind < 0:
+                # Open the row: every pair (top_nodes[first], later pool node) by estimate
+                node = top_nodes[first]
+                seconds = top_nodes[first + 1:]
+                row_totals = from_start[node] + self._node_row(distances, node, seconds) + to_end[seconds]
+                keep = np.flatnonzero(row_totals <= direct_distance * 3.5)
+                keep = keep[np.argsort(row_totals[keep], kind='stable')]
+                rows[first] = (row_totals[keep].tolist(), (keep + first + 1).tolist())
+                rank = -1
+            else:
+                yield self._path_combination(network_nodes, int(top_nodes[first]), int(top_nodes[second]), total)
+            
+            row_totals, positions = rows[first]
+            rank += 1
+            if rank < len(row_totals):
+                heapq.heappush(heap, (row_totals[rank], 1, first, positions[rank], rank))
+            else:
+                del rows[first]
+    
+    def _path_combination(self, network_nodes: List[PathNode], first: int, second: int, estimated_distance: float) -> Dict:
+        node1 = network_nodes[first]
+        if second < 0:
+            return {
+                'name': f"Single WP: {node1.name}",
+                'waypoints': [(node1.lat, node1.lon)],
+                'estimated_distance': estimated_distance,
+                'waypoint_count': 1
+            }
+        
+        node2 = network_nodes[second]
+        return {
+            'name': f"Dual WP: {node1.name} → {node2.name}",
+            'waypoints': [(node1.lat, node1.lon), (node2.lat, node2.lon)],
+            'estimated_distance': estimated_distance,
+            'waypoint_count': 2
+        }
\ No newline at end of file
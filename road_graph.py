@@ -0,0 +1,785 @@
+"""
+Offline road graph built from the bundled Overpass extract
+"""
+import glob
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from geo_distance import EARTH_RADIUS_M, distance_m_batch, haversine_m_batch
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# Free-flow urban speeds per OSM highway class (km/h)
+HIGHWAY_SPEEDS_KMH = {
+    'motorway': 80,
+    'motorway_link': 50,
+    'trunk': 60,
+    'trunk_link': 40,
+    'primary': 45,
+    'primary_link': 35,
+    'secondary': 35,
+    'secondary_link': 30,
+    'tertiary': 30,
+    'tertiary_link': 25,
+    'unclassified': 25,
+    'residential': 20,
+    'living_street': 10,
+}
+
+MAX_SNAP_DISTANCE_M = 2000
+SNAP_CELL_DEG = 0.005      # ~550 m buckets for nearest-node lookups
+_SNAP_KEY_STRIDE = 1 << 21
+
+# Compiled graph file: fixed header, then 8-byte aligned little-endian arrays
+GRAPH_MAGIC = b"RGRAPH01"
+GRAPH_VERSION = 2
+GRAPH_SUFFIX = ".roadgraph"
+COORD_SCALE = 10_000_000   # fixed-point degrees (1e-7 deg ~ 1 cm)
+LENGTH_SCALE = 10          # decimetres
+DURATION_SCALE = 10        # deciseconds
+_HEADER = struct.Struct("<8sII")
+_SECTIONS = (
+    ('osm_ids', np.int64, 'n'),
+    ('lat_e7', np.int32, 'n'),
+    ('lon_e7', np.int32, 'n'),
+    ('indptr', np.int32, 'n+1'),
+    ('indices', np.int32, 'm'),
+    ('length_dm', np.uint32, 'm'),
+    ('duration_ds', np.uint32, 'm'),
+    ('rev_indptr', np.int32, 'n+1'),
+    ('rev_sources', np.int32, 'm'),
+    ('rev_edges', np.int32, 'm'),
+    ('routable', np.uint8, 'n'),
+)
+
+
+def find_overpass_extract(cache_dir: str = CACHE_DIR) -> Optional[str]:
+    """Path of the first Overpass JSON extract in the cache directory"""
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as handle:
+            if '"elements"' in handle.read(4096):
+                return path
+    return None
+
+
+def write_array_file(path: str, magic: bytes, version: int, counts: Dict[str, int], sections, arrays: Dict[str, np.ndarray]):
+    """
+    Write named flat arrays behind a header of ``magic``, ``version`` and the
+    header values (uint64, in ``counts`` order: section counts plus any extra
+    fields such as a graph fingerprint); each array is 8-byte aligned.
+    The file is written to a temporary name and atomically moved into place.
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+
+    with open(tmp_path, "wb") as handle:
+        handle.write(_HEADER.pack(magic, version, len(counts)))
+        handle.write(struct.pack(f"<{len(counts)}Q", *counts.values()))
+        for name, dtype, _ in sections:
+            handle.write(b"\0" * (-handle.tell() % 8))
+            handle.write(np.ascontiguousarray(arrays[name], dtype=np.dtype(dtype).newbyteorder('<')).tobytes())
+
+    os.replace(tmp_path, path)
+
+
+def map_array_file(path: str, magic: bytes, version: int, count_names: Tuple[str, ...], sections) -> Tuple[Dict[str, np.ndarray], Dict[str, int], mmap.mmap]:
+    """Memory-map a file written by ``write_array_file``: (read-only array views, header values, backing map)"""
+    with open(path, "rb") as handle:
+        backing = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    file_magic, file_version, count_len = _HEADER.unpack_from(backing, 0)
+    if file_magic != magic or file_version != version or count_len != len(count_names):
+        backing.close()
+        raise ValueError(f"Unsupported array file: {path}")
+
+    values = struct.unpack_from(f"<{count_len}Q", backing, _HEADER.size)
+    header = dict(zip(count_names, values))
+    counts = dict(header)
+    counts.update({f"{name}+1": value + 1 for name, value in zip(count_names, values)})
+
+    arrays = {}
+    offset = _HEADER.size + 8 * count_len
+    for name, dtype, count in sections:
+        dtype = np.dtype(dtype).newbyteorder('<')
+        offset += -offset % 8
+        arrays[name] = np.frombuffer(backing, dtype=dtype, count=counts[count], offset=offset)
+        offset += dtype.itemsize * counts[count]
+
+    return arrays, header, backing
+
+
+def search_view(array: np.ndarray):
+    """
+    Zero-copy index view of a 1-D integer array for the search loops. Indexing
+    yields Python ints almost as fast as a list, so memory-mapped arrays are
+    searched in place on pages shared by every process instead of being copied
+    into per-process lists (those remain the fallback for non-native byte order).
+    """
+    if not array.dtype.isnative or not array.flags.c_contiguous:
+        return array.tolist()
+    return memoryview(array).cast('B').cast(array.dtype.char)
+
+
+def _way_speed_kmh(tags: Dict) -> float:
+    speed = HIGHWAY_SPEEDS_KMH[tags['highway']]
+    maxspeed = tags.get('maxspeed', '')
+    digits = maxspeed.split()[0] if maxspeed else ''
+    if digits.isdigit() and int(digits) > 0:
+        # Posted limits are an upper bound, never a promise in city traffic
+        speed = min(speed * 1.5, float(digits))
+    return speed
+
+
+def _way_directions(tags: Dict) -> Tuple[bool, bool]:
+    """(forward, backward) travel permitted along the way's node order"""
+    oneway = tags.get('oneway', '').lower()
+    if oneway in ('yes', 'true', '1'):
+        return True, False
+    if oneway == '-1':
+        return False, True
+    if oneway == 'no':
+        return True, True
+    if tags.get('junction') in ('roundabout', 'circular') or tags.get('highway') == 'motorway':
+        return True, False
+    return True, True
+
+
+class RoadGraph:
+    """
+    Directed road graph in CSR form: the outgoing edges of node ``u`` are
+    ``indices[indptr[u]:indptr[u + 1]]`` with matching ``length_dm`` and
+    ``duration_ds``. Coordinates are fixed-point (``COORD_SCALE``) and edge
+    weights are quantized integers so the whole graph is a set of flat arrays
+    that can be written once and memory-mapped read-only by every process.
+    A reverse CSR (``rev_*``) and the routable-node mask travel with it.
+    Searches index the mapped arrays in place (``search_view``); only the
+    float coordinates and the snap grid are per-process copies.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], backing: Optional[mmap.mmap] = None):
+        for name, _, _ in _SECTIONS:
+            setattr(self, name, arrays[name])
+        self._backing = backing
+        self.max_speed_mps = max(HIGHWAY_SPEEDS_KMH.values()) * 1.5 / 3.6
+
+        self._coordinates = None
+        self._adjacency = None
+        self._reverse = None
+        self._edge_sources = None
+        self._lengths = None
+        self._snap_grid = None
+        self._fingerprint = None
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lat_e7)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    @property
+    def lats(self) -> np.ndarray:
+        return self._float_coordinates()[0]
+
+    @property
+    def lons(self) -> np.ndarray:
+        return self._float_coordinates()[1]
+
+    @classmethod
+    def from_overpass(cls, path: str) -> "RoadGraph":
+        """Build the graph from an Overpass JSON extract (osmnx cache format)"""
+        with open(path, "r", encoding="utf-8") as handle:
+            elements = json.load(handle)['elements']
+
+        coordinates = {}
+        sources, targets, speeds = [], [], []
+
+        for element in elements:
+            if element['type'] == 'node':
+                coordinates[element['id']] = (element['lat'], element['lon'])
+
+        for element in elements:
+            if element['type'] != 'way':
+                continue
+            tags = element.get('tags', {})
+            if tags.get('highway') not in HIGHWAY_SPEEDS_KMH:
+                continue
+
+            nodes = [n for n in element['nodes'] if n in coordinates]
+            forward, backward = _way_directions(tags)
+            speed = _way_speed_kmh(tags)
+
+            for a, b in zip(nodes, nodes[1:]):
+                if a == b:
+                    continue
+                if forward:
+                    sources.append(a)
+                    targets.append(b)
+                    speeds.append(speed)
+                if backward:
+                    sources.append(b)
+                    targets.append(a)
+                    speeds.append(speed)
+
+        osm_ids = np.unique(np.array(sources + targets, dtype=np.int64))
+        src = np.searchsorted(osm_ids, np.array(sources, dtype=np.int64))
+        dst = np.searchsorted(osm_ids, np.array(targets, dtype=np.int64))
+
+        lats = np.array([coordinates[i][0] for i in osm_ids.tolist()], dtype=float)
+        lons = np.array([coordinates[i][1] for i in osm_ids.tolist()], dtype=float)
+
+        # Stored in the compiled graph and its fingerprint, so fixed to haversine whatever the default tier
+        lengths = haversine_m_batch(lats[src], lons[src], lats[dst], lons[dst])
+        durations = lengths / (np.array(speeds, dtype=float) / 3.6)
+
+        return cls.from_edges(osm_ids, lats, lons, src, dst, lengths, durations)
+
+    @classmethod
+    def from_edges(cls, osm_ids, lats, lons, src, dst, lengths, durations) -> "RoadGraph":
+        """Quantize and pack an edge list (lengths in m, durations in s)"""
+        n = len(osm_ids)
+        order = np.lexsort((dst, src))
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        indices = dst[order].astype(np.int32)
+
+        edge_sources = src[order]
+        rev_edges = np.argsort(indices, kind='stable').astype(np.int32)
+        rev_indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(indices, minlength=n), out=rev_indptr[1:])
+
+        arrays = {
+            'osm_ids': np.asarray(osm_ids, dtype=np.int64),
+            'lat_e7': np.round(np.asarray(lats) * COORD_SCALE).astype(np.int32),
+            'lon_e7': np.round(np.asarray(lons) * COORD_SCALE).astype(np.int32),
+            'indptr': indptr,
+            'indices': indices,
+            # Round up so a quantized weight never undercuts the true one (keeps A* bounds admissible)
+            'length_dm': np.maximum(1, np.ceil(np.asarray(lengths)[order] * LENGTH_SCALE)).astype(np.uint32),
+            'duration_ds': np.maximum(1, np.ceil(np.asarray(durations)[order] * DURATION_SCALE)).astype(np.uint32),
+            'rev_indptr': rev_indptr,
+            'rev_sources': edge_sources[rev_edges].astype(np.int32),
+            'rev_edges': rev_edges,
+            'routable': np.zeros(n, dtype=np.uint8),
+        }
+
+        graph = cls(arrays)
+        graph.routable = graph._largest_scc().astype(np.uint8)
+        return graph
+
+    def save(self, path: str):
+        """Write the compiled graph (atomically replaced)"""
+        write_array_file(path, GRAPH_MAGIC, GRAPH_VERSION, {'n': self.node_count, 'm': self.edge_count},
+                         _SECTIONS, {name: getattr(self, name) for name, _, _ in _SECTIONS})
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        """Memory-map a compiled graph read-only; pages are shared between processes"""
+        arrays, _, backing = map_array_file(path, GRAPH_MAGIC, GRAPH_VERSION, ('n', 'm'), _SECTIONS)
+        return cls(arrays, backing)
+
+    def fingerprint(self) -> Tuple[int, int]:
+        """
+        (edge count, 64-bit hash of topology and edge weights). Indexes built
+        on the graph store it, so a recompiled graph never reuses stale ones.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for array in (self.indptr, self.indices, self.duration_ds, self.length_dm):
+                digest.update(np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).data)
+            self._fingerprint = (self.edge_count, int.from_bytes(digest.digest(), 'little'))
+        return self._fingerprint
+
+    def adjacency(self) -> Tuple[Sequence[int], Sequence[int], Sequence[int]]:
+        """CSR arrays as ``search_view``s; much faster than NumPy scalars in search loops"""
+        if self._adjacency is None:
+            self._adjacency = (search_view(self.indptr), search_view(self.indices), search_view(self.duration_ds))
+        return self._adjacency
+
+    def reverse_adjacency(self) -> Tuple[Sequence[int], Sequence[int], Sequence[int]]:
+        """Incoming edges per node: (indptr, sources, forward edge ids)"""
+        if self._reverse is None:
+            self._reverse = (search_view(self.rev_indptr), search_view(self.rev_sources), search_view(self.rev_edges))
+        return self._reverse
+
+    def routable_mask(self) -> np.ndarray:
+        """Nodes of the largest strongly connected component; snapping is restricted to these"""
+        return self.routable.astype(bool)
+
+    def nearest_node(self, lat: float, lon: float) -> Tuple[int, float]:
+        """(node, distance_m) of the closest routable node"""
+        nodes, distances = self.nearest_nodes([lat], [lon])
+        return int(nodes[0]), float(distances[0])
+
+    def nearest_nodes(self, lats: Sequence[float], lons: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Closest routable node and its distance (m) for every point.
+        Routable nodes are bucketed in a lat/lon grid; each query scans growing
+        squares of cells until no cell outside the square can hold a closer node.
+        """
+        keys, grid_nodes = self._snap_node_grid()
+        lats_query = np.asarray(lats, dtype=float)
+        lons_query = np.asarray(lons, dtype=float)
+        lats, lons = self.lats, self.lons
+        nodes = np.empty(len(lats_query), dtype=np.int64)
+
+        for q, (lat, lon) in enumerate(zip(lats_query.tolist(), lons_query.tolist())):
+            row, col = math.floor(lat / SNAP_CELL_DEG), math.floor(lon / SNAP_CELL_DEG)
+            cos_lat = math.cos(math.radians(lat))
+            # Every node outside a square of radius r cells is at least r cell widths away
+            cell_m = SNAP_CELL_DEG * EARTH_RADIUS_M * math.pi / 180 * cos_lat
+            best_node, best_m = -1, math.inf
+            radius = 0
+
+            while True:
+                found = []
+                for r in range(row - radius, row + radius + 1):
+                    lo = np.searchsorted(keys, r * _SNAP_KEY_STRIDE + col - radius, side='left')
+                    hi = np.searchsorted(keys, r * _SNAP_KEY_STRIDE + col + radius, side='right')
+                    if hi > lo:
+                        found.append(grid_nodes[lo:hi])
+
+                if found:
+                    candidates = np.concatenate(found)
+                    approx = (lats[candidates] - lat) ** 2 + ((lons[candidates] - lon) * cos_lat) ** 2
+                    pick = int(np.argmin(approx))
+                    best_node = int(candidates[pick])
+                    best_m = math.sqrt(float(approx[pick])) * EARTH_RADIUS_M * math.pi / 180
+
+                if best_m <= radius * cell_m or radius * SNAP_CELL_DEG > 180:
+                    break
+                radius = max(radius + 1, math.ceil(best_m / cell_m) if best_node >= 0 else radius * 2)
+
+            nodes[q] = best_node
+
+        return nodes, distance_m_batch(lats_query, lons_query, lats[nodes], lons[nodes])
+
+    def _snap_node_grid(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Routable nodes sorted by grid cell key: (keys, nodes)"""
+        if self._snap_grid is None:
+            candidates = np.flatnonzero(self.routable)
+            rows = np.floor(self.lats[candidates] / SNAP_CELL_DEG).astype(np.int64)
+            cols = np.floor(self.lons[candidates] / SNAP_CELL_DEG).astype(np.int64)
+            keys = rows * _SNAP_KEY_STRIDE + cols
+            order = np.argsort(keys, kind='stable')
+            self._snap_grid = (keys[order], candidates[order])
+        return self._snap_grid
+
+    def shortest_path(self, source: int, target: int) -> Optional[Dict]:
+        """A* on travel time with a straight-line / top-speed heuristic"""
+        if source == target:
+            return {'nodes': [source], 'length_m': 0.0, 'duration_s': 0.0}
+
+        indptr, indices, durations = self.adjacency()
+        lats, lons = self.lats, self.lons
+        target_lat, target_lon = lats[target], lons[target]
+        cos_lat = math.cos(math.radians(target_lat))
+        m_per_deg = EARTH_RADIUS_M * math.pi / 180
+        ds_per_m = DURATION_SCALE / self.max_speed_mps
+
+        def heuristic(node: int) -> float:
+            dy = (lats[node] - target_lat) * m_per_deg
+            dx = (lons[node] - target_lon) * m_per_deg * cos_lat
+            return math.sqrt(dx * dx + dy * dy) * ds_per_m * 0.99
+
+        best = {source: 0}
+        parent = {source: -1}
+        heap = [(heuristic(source), 0, source)]
+        settled = set()
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if node == target:
+                break
+            settled.add(node)
+
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[edge]
+                new_cost = cost + durations[edge]
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    parent[neighbor] = node
+                    heapq.heappush(heap, (new_cost + heuristic(neighbor), new_cost, neighbor))
+        else:
+            return None
+
+        nodes = [target]
+        while parent[nodes[-1]] != -1:
+            nodes.append(parent[nodes[-1]])
+        nodes.reverse()
+
+        return {'nodes': nodes, 'length_m': self.path_length_m(nodes), 'duration_s': best[target] / DURATION_SCALE}
+
+    def bidirectional_dijkstra(self, source: int, target: int, closed_edges: Optional[Sequence] = None) -> Optional[Dict]:
+        """
+        Travel-time shortest path searching from both ends at once. Edges with a
+        truthy entry in the edge-indexed ``closed_edges`` overlay are skipped.
+        """
+        if source == target:
+            return {'nodes': [source], 'length_m': 0.0, 'duration_s': 0.0}
+
+        indptr, indices, durations = self.adjacency()
+        rev_indptr, rev_sources, rev_edges = self.reverse_adjacency()
+
+        dist = ({source: 0}, {target: 0})
+        parent = ({source: -1}, {target: -1})
+        heaps = ([(0, source)], [(0, target)])
+        settled = (set(), set())
+        best, meeting = math.inf, -1
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            cost, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+
+            if side == 0:
+                edges = ((edge, indices[edge]) for edge in range(indptr[node], indptr[node + 1]))
+            else:
+                edges = ((rev_edges[i], rev_sources[i]) for i in range(rev_indptr[node], rev_indptr[node + 1]))
+
+            for edge, neighbor in edges:
+                if closed_edges is not None and closed_edges[edge]:
+                    continue
+                new_cost = cost + durations[edge]
+                if new_cost < dist[side].get(neighbor, math.inf):
+                    dist[side][neighbor] = new_cost
+                    parent[side][neighbor] = node
+                    heapq.heappush(heaps[side], (new_cost, neighbor))
+
+                    other = dist[1 - side].get(neighbor)
+                    if other is not None and new_cost + other < best:
+                        best, meeting = new_cost + other, neighbor
+
+        if meeting < 0:
+            return None
+
+        nodes = [meeting]
+        while parent[0][nodes[-1]] != -1:
+            nodes.append(parent[0][nodes[-1]])
+        nodes.reverse()
+        while parent[1][nodes[-1]] != -1:
+            nodes.append(parent[1][nodes[-1]])
+
+        return {'nodes': nodes, 'length_m': self.path_length_m(nodes), 'duration_s': best / DURATION_SCALE}
+
+    def one_to_many(self, source: int, targets: List[int]) -> Tuple[List[Optional[int]], List[Optional[int]]]:
+        """Dijkstra from ``source`` until every target is settled: (durations, lengths) in graph units"""
+        indptr, indices, durations = self.adjacency()
+        lengths = self._length_list()
+        remaining = set(targets)
+        dist = {source: (0, 0)}
+        heap = [(0, 0, source)]
+        settled = {}
+
+        while heap and remaining:
+            cost, length, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = (cost, length)
+            remaining.discard(node)
+
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[edge]
+                value = (cost + durations[edge], length + lengths[edge])
+                if value < dist.get(neighbor, (math.inf, math.inf)):
+                    dist[neighbor] = value
+                    heapq.heappush(heap, (value[0], value[1], neighbor))
+
+        return ([settled[t][0] if t in settled else None for t in targets],
+                [settled[t][1] if t in settled else None for t in targets])
+
+    def closed_edge_mask(self, lats: Sequence[float], lons: Sequence[float], reach_m: Sequence[float]) -> bytearray:
+        """
+        Edge overlay closing every edge whose segment passes within ``reach_m``
+        of a circle centre. The graph itself is untouched, so overlays for
+        different blockage sets can be built and discarded freely.
+        """
+        mask = np.zeros(self.edge_count, dtype=np.uint8)
+        if len(lats) == 0:
+            return bytearray(mask)
+
+        sources = self._sources()
+        node_lats, node_lons = self.lats, self.lons
+        lat_a, lon_a = node_lats[sources], node_lons[sources]
+        lat_b, lon_b = node_lats[self.indices], node_lons[self.indices]
+        m_per_deg = EARTH_RADIUS_M * math.pi / 180
+
+        for lat, lon, reach in zip(lats, lons, reach_m):
+            dlat = reach / m_per_deg
+            dlon = reach / (m_per_deg * max(math.cos(math.radians(lat)), 1e-6))
+            near = np.flatnonzero(
+                (np.maximum(lat_a, lat_b) >= lat - dlat) & (np.minimum(lat_a, lat_b) <= lat + dlat) &
+                (np.maximum(lon_a, lon_b) >= lon - dlon) & (np.minimum(lon_a, lon_b) <= lon + dlon)
+            )
+            if len(near) == 0:
+                continue
+
+            # Closest approach of each segment to the centre in a local equirectangular frame
+            cos_lat = math.cos(math.radians(lat))
+            ax = (lon_a[near] - lon) * m_per_deg * cos_lat
+            ay = (lat_a[near] - lat) * m_per_deg
+            bx = (lon_b[near] - lon) * m_per_deg * cos_lat
+            by = (lat_b[near] - lat) * m_per_deg
+            dx, dy = bx - ax, by - ay
+            length_sq = dx * dx + dy * dy
+            t = np.where(length_sq > 0, -(ax * dx + ay * dy) / np.where(length_sq > 0, length_sq, 1), 0.0)
+            t = np.clip(t, 0.0, 1.0)
+            px, py = ax + t * dx, ay + t * dy
+            mask[near[px * px + py * py <= reach * reach]] = 1
+
+        return bytearray(mask)
+
+    def path_length_m(self, nodes: List[int]) -> float:
+        if len(nodes) < 2:
+            return 0.0
+        ids = np.asarray(nodes)
+        return float(distance_m_batch(self.lats[ids[:-1]], self.lons[ids[:-1]], self.lats[ids[1:]], self.lons[ids[1:]]).sum())
+
+    def path_points(self, nodes: List[int]) -> List[Tuple[float, float]]:
+        return [(float(self.lats[n]), float(self.lons[n])) for n in nodes]
+
+    def _length_list(self) -> Sequence[int]:
+        if self._lengths is None:
+            self._lengths = search_view(self.length_dm)
+        return self._lengths
+
+    def _sources(self) -> np.ndarray:
+        if self._edge_sources is None:
+            self._edge_sources = np.repeat(np.arange(self.node_count, dtype=np.int32), np.diff(self.indptr))
+        return self._edge_sources
+
+    def _float_coordinates(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._coordinates is None:
+            self._coordinates = (self.lat_e7 / COORD_SCALE, self.lon_e7 / COORD_SCALE)
+        return self._coordinates
+
+    def _largest_scc(self) -> np.ndarray:
+        # Iterative Kosaraju: finishing order on the forward graph, then
+        # components on the reverse graph in reverse finishing order.
+        indptr, indices, _ = self.adjacency()
+        rev_indptr, rev_sources, _ = self.reverse_adjacency()
+        n = self.node_count
+
+        visited = bytearray(n)
+        order = []
+        for root in range(n):
+            if visited[root]:
+                continue
+            visited[root] = 1
+            stack = [(root, indptr[root])]
+            while stack:
+                node, edge = stack[-1]
+                if edge < indptr[node + 1]:
+                    stack[-1] = (node, edge + 1)
+                    neighbor = indices[edge]
+                    if not visited[neighbor]:
+                        visited[neighbor] = 1
+                        stack.append((neighbor, indptr[neighbor]))
+                else:
+                    stack.pop()
+                    order.append(node)
+
+        component = [-1] * n
+        sizes = []
+        for root in reversed(order):
+            if component[root] != -1:
+                continue
+            label = len(sizes)
+            component[root] = label
+            stack = [root]
+            size = 0
+            while stack:
+                node = stack.pop()
+                size += 1
+                for edge in range(rev_indptr[node], rev_indptr[node + 1]):
+                    neighbor = rev_sources[edge]
+                    if component[neighbor] == -1:
+                        component[neighbor] = label
+                        stack.append(neighbor)
+            sizes.append(size)
+
+        largest = int(np.argmax(sizes)) if sizes else 0
+        return np.array(component) == largest
+
+
+class OfflineRouter:
+    """
+    Answers get_reliable_route-style queries on the local road graph.
+    Legs use the contraction hierarchy when one is supplied, then landmark
+    (ALT) A*, then plain A*.
+    """
+
+    def __init__(self, graph: RoadGraph, max_snap_distance_m: float = MAX_SNAP_DISTANCE_M, hierarchy=None, landmarks=None):
+        self.graph = graph
+        self.max_snap_distance_m = max_snap_distance_m
+        self.hierarchy = hierarchy
+        self.landmarks = landmarks
+
+    def route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float, waypoints: List[Tuple[float, float]] = None,
+              closed_edges: Optional[Sequence] = None) -> Optional[Dict]:
+        """
+        Route through the waypoints; None when a point is off the graph or unreachable.
+        With a ``closed_edges`` overlay every leg is a masked bidirectional Dijkstra.
+        """
+        points = [(start_lat, start_lon)]
+        if waypoints:
+            points.extend(waypoints)
+        points.append((end_lat, end_lon))
+
+        snapped = [self._snap(lat, lon) for lat, lon in points]
+        if None in snapped:
+            return None
+
+        route_nodes = [snapped[0]]
+        total_length = 0.0
+        total_duration = 0.0
+
+        for source, target in zip(snapped, snapped[1:]):
+            if closed_edges is not None:
+                leg = self.graph.bidirectional_dijkstra(source, target, closed_edges)
+            else:
+                leg = self._leg(source, target)
+            if leg is None:
+                return None
+            route_nodes.extend(leg['nodes'][1:])
+            total_length += leg['length_m']
+            total_duration += leg['duration_s']
+
+        return {
+            'route': self.graph.path_points(route_nodes),
+            'distance': total_length / 1000,
+            'duration': total_duration / 60,
+            'success': True,
+            'service': 'Offline Graph'
+        }
+
+    def matrix(self, sources: List[Tuple[float, float]], targets: List[Tuple[float, float]]) -> Optional[Dict]:
+        """
+        Travel time (minutes) and road distance (km) for every source/target
+        pair; entries are None where a point is off the graph or unreachable.
+        """
+        source_nodes = [self._snap(lat, lon) for lat, lon in sources]
+        target_nodes = [self._snap(lat, lon) for lat, lon in targets]
+        usable_sources = [node for node in source_nodes if node is not None]
+        usable_targets = [node for node in target_nodes if node is not None]
+        if not usable_sources or not usable_targets:
+            return None
+
+        if self.hierarchy is not None:
+            durations, lengths = self.hierarchy.many_to_many(usable_sources, usable_targets)
+        else:
+            rows = [self.graph.one_to_many(node, usable_targets) for node in usable_sources]
+            durations, lengths = [row[0] for row in rows], [row[1] for row in rows]
+
+        source_rows = iter(zip(durations, lengths))
+        duration_matrix, distance_matrix = [], []
+        for source_node in source_nodes:
+            row_durations, row_lengths = next(source_rows) if source_node is not None else ([], [])
+            columns = iter(zip(row_durations, row_lengths))
+            duration_row, distance_row = [], []
+            for target_node in target_nodes:
+                duration, length = next(columns) if source_node is not None and target_node is not None else (None, None)
+                duration_row.append(None if duration is None else duration / DURATION_SCALE / 60)
+                distance_row.append(None if length is None else length / LENGTH_SCALE / 1000)
+            duration_matrix.append(duration_row)
+            distance_matrix.append(distance_row)
+
+        return {
+            'durations': duration_matrix,
+            'distances': distance_matrix,
+            'success': True,
+            'service': 'Offline Graph'
+        }
+
+    def _snap(self, lat: float, lon: float) -> Optional[int]:
+        node, distance = self.graph.nearest_node(lat, lon)
+        return node if distance <= self.max_snap_distance_m else None
+
+    def _leg(self, source: int, target: int) -> Optional[Dict]:
+        if self.hierarchy is not None:
+            return self.hierarchy.query(source, target)
+        if self.landmarks is not None:
+            return self.landmarks.shortest_path(source, target)
+        return self.graph.shortest_path(source, target)
+
+
+_GRAPH_CACHE: Dict[str, RoadGraph] = {}
+_GRAPH_LOCK = threading.Lock()
+
+
+def compiled_graph_path(extract_path: str) -> str:
+    return os.path.splitext(extract_path)[0] + GRAPH_SUFFIX
+
+
+def derived_file_is_current(path: str, extract_path: str) -> bool:
+    """Whether an index built from the road graph exists and postdates both the extract and its compiled graph"""
+    if not os.path.exists(path):
+        return False
+    sources = [extract_path, compiled_graph_path(extract_path)]
+    return all(os.path.getmtime(path) >= os.path.getmtime(source) for source in sources if os.path.exists(source))
+
+
+def compile_road_graph(extract_path: str, output_path: Optional[str] = None) -> str:
+    """Parse the Overpass extract once and write the compact binary graph"""
+    output_path = output_path or compiled_graph_path(extract_path)
+    RoadGraph.from_overpass(extract_path).save(output_path)
+    return output_path
+
+
+def load_road_graph(path: Optional[str] = None) -> Optional[RoadGraph]:
+    """
+    Process-wide road graph for the extract at ``path`` (default: the bundled one).
+    Maps the compiled file when it is up to date, compiling it first otherwise.
+    """
+    path = path or find_overpass_extract()
+    if path is None:
+        return None
+
+    with _GRAPH_LOCK:
+        if path not in _GRAPH_CACHE:
+            compiled = compiled_graph_path(path)
+            graph = None
+
+            if os.path.exists(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(path):
+                try:
+                    graph = RoadGraph.load(compiled)
+                except (OSError, ValueError):
+                    graph = None
+
+            if graph is None:
+                try:
+                    graph = RoadGraph.load(compile_road_graph(path, compiled))
+                except OSError:
+                    # Read-only checkout: fall back to the in-memory graph
+                    graph = RoadGraph.from_overpass(path)
+
+            _GRAPH_CACHE[path] = graph
+
+        return _GRAPH_CACHE[path]
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else find_overpass_extract()
+    if source is None:
+        sys.exit("No Overpass extract found in cache/")
+    target = compile_road_graph(source, sys.argv[2] if len(sys.argv) > 2 else None)
+    graph = RoadGraph.load(target)
+    print(f"Compiled {source} -> {target}: {graph.node_count} nodes, {graph.edge_count} edges, "
+          f"{os.path.getsize(target) / 1e6:.1f} MB")
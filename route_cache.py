@@ -0,0 +1,140 @@
+"""
+Persistent on-disk cache for routing service responses
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "osrm_responses.sqlite3")
+
+
+class RouteCache:
+    """Single-file SQLite cache with TTL expiry and size-bounded LRU eviction"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = 24 * 3600,
+                 max_entries: int = 5000, precision: int = 5):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        try:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            self._conn.commit()
+        except sqlite3.Error:
+            # An unusable cache must never break routing; every lookup becomes a miss.
+            self._conn = None
+
+    def make_key(self, coordinates: List[Tuple[float, float]], params: Dict) -> str:
+        """Stable key from normalized (lat, lon) coordinates and request params"""
+        coord_part = ";".join(f"{lat:.{self.precision}f},{lon:.{self.precision}f}" for lat, lon in coordinates)
+        param_part = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(f"{coord_part}|{param_part}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached response or None on miss/expiry"""
+        if self._conn is None:
+            self.misses += 1
+            return None
+
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                value, created_at = row
+                if now - created_at > self.ttl_seconds:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self.misses += 1
+                    return None
+
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return json.loads(value)
+            except (sqlite3.Error, ValueError):
+                self.misses += 1
+                return None
+
+    def put(self, key: str, value: Dict):
+        """Store a response and evict least recently used entries beyond max_entries"""
+        if self._conn is None:
+            return
+
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, separators=(",", ":")), now, now)
+                )
+
+                count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                overflow = count - self.max_entries
+                if overflow > 0:
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        " SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                        (overflow,)
+                    )
+                    self.evictions += overflow
+
+                self._conn.commit()
+            except (sqlite3.Error, TypeError, ValueError):
+                pass
+
+    def clear(self):
+        """Drop every cached response"""
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        entries = 0
+        if self._conn is not None:
+            with self._lock:
+                try:
+                    entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                except sqlite3.Error:
+                    entries = 0
+
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': entries,
+            'hit_rate': (self.hits / lookups * 100) if lookups > 0 else 0.0
+        }
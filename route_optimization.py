@@ -1,14 +1,14 @@
 import streamlit as st
 import folium
 from enhanced_navigation import EnhancedNavigationSystem
-from geopy.distance import geodesic
+from geo_distance import distance_km
 
 def create_map_visualization(start, end, route_data, blockages, direct_route_data=None):
     
     center_lat = (start.lat + end.lat) / 2
     center_lon = (start.lon + start.lon) / 2
     
-    distance = geodesic((start.lat, start.lon), (end.lat, end.lon)).kilometers
+    distance = distance_km((start.lat, start.lon), (end.lat, end.lon))
     zoom = max(11, 15 - int(distance / 5))
     
     m = folium.Map(
@@ -67,6 +67,10 @@ def create_map_visualization(start, end, route_data, blockages, direct_route_dat
             color = '#F39C12'
             weight = 5
             opacity = 0.7
+        elif '⚪' in route_type:
+            color = '#95A5A6'
+            weight = 5
+            opacity = 0.7
         else:
             color = '#E74C3C'
             weight = 5
@@ -272,7 +276,7 @@ def main():
                     """)
                     
                     if st.button("Remove", key=f"del_{idx}"):
-                        nav_system.blockages.pop(idx)
+                        nav_system.remove_blockage(idx)
                         st.rerun()
                 
                 st.markdown("---")
@@ -385,10 +389,13 @@ def main():
         
         if hasattr(st.session_state, 'current_route') and st.session_state.current_route.get('success'):
             try:
+                # Keep the analysis in step with obstacle edits; only changed obstacles are recomputed
+                current_route = nav_system.route_with_current_obstacles(st.session_state.current_route)
+                
                 route_map = create_map_visualization(
                     st.session_state.start_location,
                     st.session_state.end_location,
-                    st.session_state.current_route,
+                    current_route,
                     nav_system.blockages,
                     st.session_state.get('direct_reference')
                 )
@@ -396,7 +403,7 @@ def main():
                 st.components.v1.html(route_map._repr_html_(), height=600)
                 
                 with st.expander("📋 Detailed Analysis"):
-                    route_info = st.session_state.current_route
+                    route_info = current_route
                     
                     detail_col1, detail_col2 = st.columns(2)
                     
@@ -414,6 +421,9 @@ def main():
                         st.write(f"• Efficiency: {route_info.get('efficiency_score', 0):.1f}%")
                         st.write(f"• Impact: {route_info.get('blockage_impact', 0):.1f}%")
         
+                    if route_info.get('stale'):
+                        st.warning(f"🔄 {route_info['warning']}")
+                    
                     conflicts = route_info.get('conflicts', {})
                     if conflicts.get('has_conflicts'):
                         st.markdown("**⚠️ Conflict Analysis:**")
@@ -0,0 +1,203 @@
+"""
+Uniform-grid spatial index over blockages
+"""
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+METERS_PER_DEGREE = 111320.0
+_KEY_STRIDE = 1 << 21
+
+
+class BlockageGridIndex:
+    """
+    Buckets blockages into fixed-size lat/lon cells.
+
+    Every blockage is registered in all cells touched by its circle grown by
+    ``buffer_m``, so a point only has to be tested against the blockages listed
+    in its own cell for any query buffer up to ``buffer_m``. Larger buffers
+    widen the lookup to the neighbouring cells.
+    """
+
+    def __init__(self, blockages: Optional[Iterable] = None, cell_size_m: float = 1000.0, buffer_m: float = 500.0):
+        self.cell_size_m = cell_size_m
+        self.cell_size_deg = cell_size_m / METERS_PER_DEGREE
+        self.buffer_m = buffer_m
+        self._blockages = []
+        self._cells: Dict[Tuple[int, int], List] = {}
+        self._registered: Dict[object, List[Tuple[int, int]]] = {}
+        self._arrays = None
+        self._positions = None
+
+        for blockage in blockages or []:
+            self.insert(blockage)
+
+    @classmethod
+    def ensure(cls, blockages) -> "BlockageGridIndex":
+        """Return ``blockages`` if it already is an index, otherwise index the list"""
+        if isinstance(blockages, cls):
+            return blockages
+        return cls(blockages)
+
+    def __len__(self) -> int:
+        return len(self._blockages)
+
+    def __iter__(self) -> Iterator:
+        return iter(self._blockages)
+
+    def __getitem__(self, position: int):
+        return self._blockages[position]
+
+    @property
+    def blockages(self) -> List:
+        """Indexed blockages in insertion order"""
+        return self._blockages
+
+    @property
+    def lats(self) -> np.ndarray:
+        return self._columns()[0]
+
+    @property
+    def lons(self) -> np.ndarray:
+        return self._columns()[1]
+
+    @property
+    def radii(self) -> np.ndarray:
+        return self._columns()[2]
+
+    def insert(self, blockage):
+        """Add a blockage to every cell its buffered footprint overlaps"""
+        cells = list(self._footprint_cells(blockage.lat, blockage.lon, blockage.radius + self.buffer_m))
+        for cell in cells:
+            self._cells.setdefault(cell, []).append(blockage)
+
+        self._registered[blockage] = cells
+        self._blockages.append(blockage)
+        self._invalidate()
+
+    def remove(self, blockage):
+        """Drop a previously inserted blockage"""
+        cells = self._registered.pop(blockage, None)
+        if cells is None:
+            return
+
+        for cell in cells:
+            bucket = self._cells.get(cell)
+            if bucket is None:
+                continue
+            bucket.remove(blockage)
+            if not bucket:
+                del self._cells[cell]
+
+        self._blockages.remove(blockage)
+        self._invalidate()
+
+    def clear(self):
+        """Remove every blockage"""
+        self._blockages = []
+        self._cells = {}
+        self._registered = {}
+        self._invalidate()
+
+    def query(self, lat: float, lon: float, buffer_m: float = 0.0) -> List:
+        """Blockages whose circle grown by ``buffer_m`` may contain the point, in insertion order"""
+        return [self._blockages[p] for p in self.query_positions(lat, lon, buffer_m)]
+
+    def query_positions(self, lat: float, lon: float, buffer_m: float = 0.0) -> np.ndarray:
+        """Sorted positions in ``self.blockages`` of the candidates returned by ``query``"""
+        row, col = self._cell(lat, lon)
+        return self._cell_positions(row, col, buffer_m)
+
+    def bbox_positions(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, buffer_m: float = 0.0) -> np.ndarray:
+        """Sorted positions of blockages whose buffered bounding box overlaps the given box"""
+        if not self._blockages:
+            return np.zeros(0, dtype=np.int64)
+
+        lats, lons, radii = self._columns()
+        dlat = (radii + buffer_m) / METERS_PER_DEGREE
+        cos_lat = np.maximum(np.cos(np.radians(np.minimum(89.0, np.abs(lats) + dlat))), 1e-6)
+        dlon = (radii + buffer_m) / (METERS_PER_DEGREE * cos_lat)
+
+        overlaps = ((lats + dlat >= min_lat) & (lats - dlat <= max_lat) &
+                    (lons + dlon >= min_lon) & (lons - dlon <= max_lon))
+        return np.flatnonzero(overlaps)
+
+    def candidate_groups(self, lats: np.ndarray, lons: np.ndarray, buffer_m: float = 0.0) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Group points by grid cell and yield ``(point_indices, blockage_positions)``
+        for every occupied cell that has nearby blockages. Positions index
+        ``self.blockages`` and are sorted, so the first hit is the earliest blockage.
+        """
+        if len(lats) == 0 or not self._blockages:
+            return
+
+        rows = np.floor(np.asarray(lats) / self.cell_size_deg).astype(np.int64)
+        cols = np.floor(np.asarray(lons) / self.cell_size_deg).astype(np.int64)
+        keys = rows * _KEY_STRIDE + cols
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(sorted_keys)]))
+
+        for start, end in zip(starts, ends):
+            point_indices = order[start:end]
+            first = point_indices[0]
+            positions = self._cell_positions(int(rows[first]), int(cols[first]), buffer_m)
+            if len(positions):
+                yield point_indices, positions
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_size_deg)), int(math.floor(lon / self.cell_size_deg))
+
+    def _footprint_cells(self, lat: float, lon: float, reach_m: float) -> Iterator[Tuple[int, int]]:
+        dlat = reach_m / METERS_PER_DEGREE
+        # Use the widest longitude span over the footprint so cells are never missed
+        cos_lat = max(math.cos(math.radians(min(89.0, abs(lat) + dlat))), 1e-6)
+        dlon = reach_m / (METERS_PER_DEGREE * cos_lat)
+
+        row_min, col_min = self._cell(lat - dlat, lon - dlon)
+        row_max, col_max = self._cell(lat + dlat, lon + dlon)
+
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                yield row, col
+
+    def _cell_positions(self, row: int, col: int, buffer_m: float) -> np.ndarray:
+        extra_m = buffer_m - self.buffer_m
+        if extra_m <= 0:
+            bucket = self._cells.get((row, col), ())
+        else:
+            lat = (row + 0.5) * self.cell_size_deg
+            cos_lat = max(math.cos(math.radians(min(89.0, abs(lat) + self.cell_size_deg))), 1e-6)
+            row_span = int(math.ceil(extra_m / (METERS_PER_DEGREE * self.cell_size_deg)))
+            col_span = int(math.ceil(extra_m / (METERS_PER_DEGREE * cos_lat * self.cell_size_deg)))
+            seen = {}
+            for r in range(row - row_span, row + row_span + 1):
+                for c in range(col - col_span, col + col_span + 1):
+                    for blockage in self._cells.get((r, c), ()):
+                        seen[blockage] = True
+            bucket = seen.keys()
+
+        positions = self._position_map()
+        return np.array(sorted(positions[b] for b in bucket), dtype=np.int64)
+
+    def _position_map(self) -> Dict[object, int]:
+        if self._positions is None:
+            self._positions = {blockage: i for i, blockage in enumerate(self._blockages)}
+        return self._positions
+
+    def _columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = (
+                np.array([b.lat for b in self._blockages], dtype=float),
+                np.array([b.lon for b in self._blockages], dtype=float),
+                np.array([b.radius for b in self._blockages], dtype=float)
+            )
+        return self._arrays
+
+    def _invalidate(self):
+        self._arrays = None
+        self._positions = None
@@ -0,0 +1,189 @@
+"""
+Equivalence checks for the offline speed-up indexes: contraction hierarchy,
+ALT landmarks and masked bidirectional Dijkstra must return the same travel
+times as plain A* on the road graph.
+
+The graph is a small synthetic street grid, so the suite runs in seconds and
+needs neither the bundled extract nor a network connection.
+"""
+import random
+
+import numpy as np
+import pytest
+
+from contraction_hierarchy import ContractionHierarchy
+from geo_distance import haversine_m
+from landmarks import LandmarkIndex
+from road_graph import RoadGraph, DURATION_SCALE, HIGHWAY_SPEEDS_KMH
+
+GRID_SIZE = 18
+GRID_STEP_DEG = 0.002       # ~200 m blocks
+ONE_WAY_SHARE = 0.2
+PAIRS = 200
+BLOCKAGES = 4
+
+
+def _grid_edges(seed: int = 7):
+    """Street grid around Mumbai with mixed road classes and some one-way streets"""
+    rng = random.Random(seed)
+    speeds = [speed for speed in HIGHWAY_SPEEDS_KMH.values() if speed >= 20]
+    rows, cols = np.divmod(np.arange(GRID_SIZE * GRID_SIZE), GRID_SIZE)
+    lats = 19.05 + rows * GRID_STEP_DEG + np.array([rng.uniform(-2e-4, 2e-4) for _ in rows])
+    lons = 72.85 + cols * GRID_STEP_DEG + np.array([rng.uniform(-2e-4, 2e-4) for _ in cols])
+
+    src, dst, lengths, durations = [], [], [], []
+
+    def add(u: int, v: int, speed_kmh: float):
+        length = haversine_m(lats[u], lons[u], lats[v], lons[v])
+        src.append(u)
+        dst.append(v)
+        lengths.append(length)
+        durations.append(length / (speed_kmh / 3.6))
+
+    for node in range(GRID_SIZE * GRID_SIZE):
+        row, col = divmod(node, GRID_SIZE)
+        for neighbor in ((node + 1) if col + 1 < GRID_SIZE else None, (node + GRID_SIZE) if row + 1 < GRID_SIZE else None):
+            if neighbor is None:
+                continue
+            speed = rng.choice(speeds)
+            if rng.random() < ONE_WAY_SHARE:
+                add(*((node, neighbor) if rng.random() < 0.5 else (neighbor, node)), speed)
+            else:
+                add(node, neighbor, speed)
+                add(neighbor, node, speed)
+
+    return lats, lons, np.array(src), np.array(dst), np.array(lengths), np.array(durations)
+
+
+def _build(lats, lons, src, dst, lengths, durations) -> RoadGraph:
+    return RoadGraph.from_edges(np.arange(len(lats)), lats, lons, src, dst, lengths, durations)
+
+
+def _path_cost(graph: RoadGraph, nodes, closed_edges=None) -> int:
+    """Travel time of a node path in graph units, asserting every hop is an open edge"""
+    indptr, indices, durations = graph.adjacency()
+    total = 0
+    for u, v in zip(nodes, nodes[1:]):
+        hops = [edge for edge in range(indptr[u], indptr[u + 1])
+                if indices[edge] == v and (closed_edges is None or not closed_edges[edge])]
+        assert hops, f"path uses a missing or closed edge {u} -> {v}"
+        total += min(durations[edge] for edge in hops)
+    return total
+
+
+def _assert_same_route(graph: RoadGraph, reference, result, source: int, target: int, closed_edges=None):
+    if reference is None:
+        assert result is None
+        return
+    assert result is not None
+    assert result['nodes'][0] == source and result['nodes'][-1] == target
+    assert result['duration_s'] == reference['duration_s']
+    assert _path_cost(graph, result['nodes'], closed_edges) == round(result['duration_s'] * DURATION_SCALE)
+
+
+@pytest.fixture(scope="module")
+def edges():
+    return _grid_edges()
+
+
+@pytest.fixture(scope="module")
+def graph(edges):
+    return _build(*edges)
+
+
+@pytest.fixture(scope="module")
+def hierarchy(graph):
+    return ContractionHierarchy.build(graph)
+
+
+@pytest.fixture(scope="module")
+def landmarks(graph):
+    return LandmarkIndex.build(graph, count=8)
+
+
+@pytest.fixture(scope="module")
+def pairs(graph):
+    rng = random.Random(11)
+    routable = np.flatnonzero(graph.routable_mask()).tolist()
+    return [(rng.choice(routable), rng.choice(routable)) for _ in range(PAIRS)]
+
+
+@pytest.fixture(scope="module")
+def blocked(edges, graph):
+    """Edge mask for a few blockage circles, plus the same network with those edges removed"""
+    rng = random.Random(23)
+    lats, lons, src, dst, lengths, durations = edges
+    centres = rng.sample(range(graph.node_count), BLOCKAGES)
+    mask = graph.closed_edge_mask(graph.lats[centres], graph.lons[centres], [250.0] * BLOCKAGES)
+    assert any(mask)
+
+    sources = graph._sources()
+    closed = {(int(sources[edge]), int(graph.indices[edge])) for edge in range(graph.edge_count) if mask[edge]}
+    keep = np.array([(int(u), int(v)) not in closed for u, v in zip(src, dst)])
+    reduced = _build(lats, lons, src[keep], dst[keep], lengths[keep], durations[keep])
+    return mask, reduced
+
+
+def test_contraction_hierarchy_matches_astar(graph, hierarchy, pairs):
+    for source, target in pairs:
+        _assert_same_route(graph, graph.shortest_path(source, target), hierarchy.query(source, target), source, target)
+
+
+def test_contraction_hierarchy_matrix_matches_astar(graph, hierarchy, pairs):
+    sources = [source for source, _ in pairs[:12]]
+    targets = [target for _, target in pairs[:12]]
+    durations, lengths = hierarchy.many_to_many(sources, targets)
+    for i, source in enumerate(sources):
+        for j, target in enumerate(targets):
+            reference = graph.shortest_path(source, target)
+            assert durations[i][j] == round(reference['duration_s'] * DURATION_SCALE)
+            assert lengths[i][j] is not None
+
+
+def test_landmarks_match_astar(graph, landmarks, pairs):
+    for source, target in pairs:
+        _assert_same_route(graph, graph.shortest_path(source, target), landmarks.shortest_path(source, target), source, target)
+
+
+def test_bidirectional_dijkstra_matches_astar(graph, pairs):
+    for source, target in pairs:
+        _assert_same_route(graph, graph.shortest_path(source, target), graph.bidirectional_dijkstra(source, target), source, target)
+
+
+def test_masked_searches_match_astar_without_closed_edges(graph, landmarks, pairs, blocked):
+    mask, reduced = blocked
+    for source, target in pairs:
+        reference = reduced.shortest_path(source, target)
+        _assert_same_route(graph, reference, graph.bidirectional_dijkstra(source, target, closed_edges=mask), source, target, mask)
+        _assert_same_route(graph, reference, landmarks.shortest_path(source, target, closed_edges=mask), source, target, mask)
+
+
+def _reweighted(graph: RoadGraph) -> RoadGraph:
+    """Same nodes and edges with every travel time one unit longer, as after a speed table change"""
+    arrays = {name: getattr(graph, name) for name in ('osm_ids', 'lat_e7', 'lon_e7', 'indptr', 'indices', 'length_dm',
+                                                      'duration_ds', 'rev_indptr', 'rev_sources', 'rev_edges', 'routable')}
+    return RoadGraph({**arrays, 'duration_ds': graph.duration_ds + 1})
+
+
+def test_saved_hierarchy_only_loads_for_its_graph(graph, hierarchy, pairs, tmp_path):
+    path = str(tmp_path / "grid.ch")
+    hierarchy.save(path)
+
+    loaded = ContractionHierarchy.load(graph, path)
+    for source, target in pairs[:20]:
+        assert loaded.query(source, target)['duration_s'] == hierarchy.query(source, target)['duration_s']
+
+    with pytest.raises(ValueError):
+        ContractionHierarchy.load(_reweighted(graph), path)
+
+
+def test_saved_landmarks_only_load_for_their_graph(graph, landmarks, pairs, tmp_path):
+    path = str(tmp_path / "grid.alt")
+    landmarks.save(path)
+
+    loaded = LandmarkIndex.load(graph, path)
+    for source, target in pairs[:20]:
+        assert loaded.shortest_path(source, target)['duration_s'] == landmarks.shortest_path(source, target)['duration_s']
+
+    with pytest.raises(ValueError):
+        LandmarkIndex.load(_reweighted(graph), path)
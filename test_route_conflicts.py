@@ -0,0 +1,128 @@
+"""
+Checks for the conflict detection used by the avoidance search: the exact
+segment-circle intersection must agree with densely sampled routes, and a
+chain's report stitched from cached leg rows must equal a fresh report of the
+stitched route.
+
+Routes and blockages are random around Mumbai, so the suite needs neither the
+road graph nor a network connection.
+"""
+import random
+
+import numpy as np
+import pytest
+
+from geo_distance import haversine_m_batch
+from optimized_routing import CONFLICT_BUFFER_M, Blockage, OptimizedRouteEngine, _segment_circle_hits
+from route_cache import RouteCache
+from spatial_index import BlockageGridIndex
+
+CASES = 200
+CHAIN_CASES = 50
+SAMPLES_PER_SEGMENT = 1001
+BOUNDARY_MARGIN_M = 1.0     # sampling cannot tell hits this close to the circle apart
+
+
+def _random_route(rng: random.Random, points: int = 25):
+    """Random walk of 50-800 m hops around Mumbai"""
+    lat, lon = rng.uniform(18.95, 19.2), rng.uniform(72.82, 72.95)
+    route = [(lat, lon)]
+    for _ in range(points - 1):
+        hop_deg = rng.uniform(50, 800) / 111000
+        heading = rng.uniform(0, 2 * np.pi)
+        lat += hop_deg * np.cos(heading)
+        lon += hop_deg * np.sin(heading) / np.cos(np.radians(lat))
+        route.append((lat, lon))
+    return np.array(route)
+
+
+def _random_blockages(rng: random.Random, route: np.ndarray, count: int = 5):
+    """Blockages centred near random route points so many of them touch the route"""
+    blockages = []
+    for i in range(count):
+        lat, lon = route[rng.randrange(len(route))]
+        blockages.append(Blockage(lat + rng.uniform(-0.01, 0.01), lon + rng.uniform(-0.01, 0.01), rng.uniform(100, 1500), f"B{i}"))
+    return blockages
+
+
+def _sampled_hits(route: np.ndarray, blockages):
+    """(segment, blockage) -> (closest distance, first and last sampled t inside), by dense sampling"""
+    t = np.linspace(0.0, 1.0, SAMPLES_PER_SEGMENT)
+    a, b = route[:-1, None, :], route[1:, None, :]
+    samples = a + (b - a) * t[None, :, None]
+    reference = {}
+    for position, blockage in enumerate(blockages):
+        distances = haversine_m_batch(samples[..., 0], samples[..., 1], blockage.lat, blockage.lon)
+        reach = blockage.radius + CONFLICT_BUFFER_M
+        for segment, row in enumerate(distances):
+            inside = np.flatnonzero(row <= reach)
+            reference[(segment, position)] = (float(row.min()), reach,
+                                              float(t[inside[0]]) if len(inside) else None,
+                                              float(t[inside[-1]]) if len(inside) else None)
+    return reference
+
+
+@pytest.mark.parametrize("seed", range(CASES))
+def test_exact_hits_match_dense_sampling(seed):
+    rng = random.Random(seed)
+    route = _random_route(rng)
+    blockages = _random_blockages(rng, route)
+
+    hits = _segment_circle_hits(route, BlockageGridIndex(blockages), CONFLICT_BUFFER_M)
+    exact = {(int(segment), int(position)): row
+             for row, (segment, position) in enumerate(zip(hits['segment'], hits['blockage']))}
+
+    for key, (closest, reach, first_inside, last_inside) in _sampled_hits(route, blockages).items():
+        if abs(closest - reach) < BOUNDARY_MARGIN_M:
+            continue
+
+        assert (key in exact) == (closest <= reach), f"segment {key[0]} / blockage {key[1]}"
+        if key not in exact:
+            continue
+
+        row = exact[key]
+        step = 1.0 / (SAMPLES_PER_SEGMENT - 1)
+        assert hits['distance'][row] == pytest.approx(closest, abs=0.5)
+        assert hits['t_enter'][row] == pytest.approx(first_inside, abs=step + 1e-3)
+        assert hits['t_exit'][row] == pytest.approx(last_inside, abs=step + 1e-3)
+
+
+def _random_leg(rng: random.Random, start, end, bends: int = 8):
+    """Leg geometry from start to end through jittered intermediate points, shaped like a route response"""
+    t = np.linspace(0.0, 1.0, bends + 2)[1:-1]
+    middle = [(start[0] + (end[0] - start[0]) * f + rng.uniform(-0.004, 0.004),
+               start[1] + (end[1] - start[1]) * f + rng.uniform(-0.004, 0.004)) for f in t]
+    route = [tuple(start)] + middle + [tuple(end)]
+    distance = float(haversine_m_batch(*np.array(route[:-1]).T, *np.array(route[1:]).T).sum()) / 1000
+    return {'route': route, 'distance': distance, 'duration': distance, 'success': True, 'service': 'Test'}
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    return OptimizedRouteEngine(route_cache=RouteCache(str(tmp_path_factory.mktemp("cache") / "routes.sqlite3")))
+
+
+@pytest.mark.parametrize("seed", range(CHAIN_CASES))
+def test_chain_conflicts_match_stitched_route(engine, seed):
+    rng = random.Random(1000 + seed)
+    chain_points = [tuple(point) for point in _random_route(rng, points=rng.randint(2, 5))]
+    legs = []
+    for leg_start, leg_end in zip(chain_points, chain_points[1:]):
+        leg = _random_leg(rng, leg_start, leg_end)
+        engine.leg_cache.put(leg_start, leg_end, leg)
+        legs.append(leg)
+
+    blockages = _random_blockages(rng, np.array(chain_points), count=rng.randint(1, 6))
+    stitched = engine.chain_conflicts(chain_points, blockages)
+    fresh = engine.calculate_route_conflicts(engine._stitch_legs(legs)['route'], blockages)
+
+    assert stitched['has_conflicts'] == fresh['has_conflicts']
+    assert stitched['total_points'] == fresh['total_points']
+    assert stitched['total_length'] == pytest.approx(fresh['total_length'])
+    assert stitched['conflict_length'] == pytest.approx(fresh['conflict_length'], abs=1e-6)
+    assert stitched['conflict_percentage'] == pytest.approx(fresh['conflict_percentage'], abs=1e-9)
+    assert [(c['index'], c['blockage'].description) for c in stitched['conflict_points']] == \
+        [(c['index'], c['blockage'].description) for c in fresh['conflict_points']]
+    for ours, theirs in zip(stitched['conflict_points'], fresh['conflict_points']):
+        assert ours['point'] == pytest.approx(theirs['point'])
+        assert ours['distance_to_center'] == pytest.approx(theirs['distance_to_center'])